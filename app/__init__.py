@@ -15,10 +15,6 @@ from datetime import date
 
 import pygogo as gogo
 
-from mezmorize.utils import get_cache_config, get_cache_type
-from rq_dashboard import default_settings
-from rq_dashboard.cli import add_basic_auth
-
 import config
 
 __version__ = "0.8.1"
@@ -36,12 +32,58 @@ cors = CORS()
 logger = gogo.Gogo(__name__, monolog=True).logger
 
 
+def check_settings(app):
+    required_setting_missing = False
+    server_name = app.config.get("SERVER_NAME")
+
+    for setting in app.config.get("REQUIRED_SETTINGS", []):
+        if not app.config.get(setting):
+            required_setting_missing = True
+            logger.error(f"App setting {setting} is missing!")
+
+    if app.config.get("PROD_SERVER"):
+        if server_name:
+            logger.info(f"SERVER_NAME is {server_name}.")
+        else:
+            logger.error(f"SERVER_NAME is not set!")
+
+        for setting in app.config.get("REQUIRED_PROD_SETTINGS", []):
+            if not app.config.get(setting):
+                required_setting_missing = True
+                logger.error(f"App setting {setting} is missing!")
+
+    if not required_setting_missing:
+        logger.info(f"All required app settings present!")
+
+
+def init_cache(app):
+    from mezmorize.utils import get_cache_config, get_cache_type
+
+    if app.config.get("HEROKU") or app.config.get("DEBUG_MEMCACHE"):
+        cache_type = get_cache_type(spread=False)
+    else:
+        cache_type = "filesystem"
+
+    # the filesystem cache and the order snapshots (see `app.snapshot`) live
+    # here (mezmorize would otherwise default to the working directory)
+    cache_dir = path.join(path.abspath(path.dirname(__file__)), "cache")
+    app.config.setdefault("CACHE_DIR", cache_dir)
+    cache_config = get_cache_config(cache_type, **app.config)
+    cache.init_app(app, config=cache_config)
+
+
 def create_app(config_mode=None, config_file=None):
+    # these are only needed to build the app, so keep them out of `import app`
+    # (rq workers import `app.api` for every job)
+    from rq_dashboard import default_settings, blueprint as rq
+    from rq_dashboard.cli import add_basic_auth
+
+    from app.api import blueprint as api
+
     app = Flask(__name__)
     app.url_map.strict_slashes = False
     cors.init_app(app)
     compress.init_app(app)
-    required_setting_missing = False
 
     @app.before_request
     def clear_trailing():
@@ -62,26 +104,8 @@ def create_app(config_mode=None, config_file=None):
     username = app.config.get("RQ_DASHBOARD_USERNAME")
     password = app.config.get("RQ_DASHBOARD_PASSWORD")
     prefix = app.config.get("API_URL_PREFIX")
-    server_name = app.config.get("SERVER_NAME")
 
-    for setting in app.config.get("REQUIRED_SETTINGS", []):
-        if not app.config.get(setting):
-            required_setting_missing = True
-            logger.error(f"App setting {setting} is missing!")
-
-    if app.config.get("PROD_SERVER"):
-        if server_name:
-            logger.info(f"SERVER_NAME is {server_name}.")
-        else:
-            logger.error(f"SERVER_NAME is not set!")
-
-        for setting in app.config.get("REQUIRED_PROD_SETTINGS", []):
-            if not app.config.get(setting):
-                required_setting_missing = True
-                logger.error(f"App setting {setting} is missing!")
-
-    if not required_setting_missing:
-        logger.info(f"All required app settings present!")
+    check_settings(app)
 
     if username and password:
         add_basic_auth(blueprint=rq, username=username, password=password)
@@ -95,28 +119,8 @@ def create_app(config_mode=None, config_file=None):
 
         Talisman(app)
 
-    if app.config.get("HEROKU") or app.config.get("DEBUG_MEMCACHE"):
-        cache_type = get_cache_type(spread=False)
-    else:
-        cache_type = "filesystem"
-
     if config_mode not in {"Production", "Custom", "Ngrok"}:
         app.config["ENVIRONMENT"] = "staging"
 
-    cache_config = get_cache_config(cache_type, **app.config)
-
-    ###########################################################################
-    # TODO - remove once mezmorize PR is merged
-    if cache_type == "filesystem" and not cache_config.get("CACHE_DIR"):
-        cache_config["CACHE_DIR"] = path.join(
-            path.abspath(path.dirname(__file__)), "cache"
-        )
-    ###########################################################################
-
-    cache.init_app(app, config=cache_config)
+    init_cache(app)
     return app
-
-
-# put at bottom to avoid circular reference errors
-from app.api import blueprint as api  # noqa
-from rq_dashboard import blueprint as rq  # noqa
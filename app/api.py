@@ -9,22 +9,23 @@ Endpoints:
     Visit the live site for a list of all available endpoints
 """
 import json
-import time
-import requests
 
+from collections import Counter
 from datetime import timedelta, date, datetime
-from itertools import cycle, islice, dropwhile
+from itertools import chain, count, cycle, islice, dropwhile, filterfalse
 
 from flask import Blueprint, current_app as app, request, url_for
+from flask import stream_with_context
 from flask.views import MethodView
-from rq import Queue
 
 from config import Config
-from app import cache
-from app.utils import jsonify, parse, get_request_base, get_links
-from app.connection import conn
+from app import cache, dashboard, index, instrument, jobs, metrics, scheduler
+from app import backfill, breaker, budget, export, locks, planner, progress
+from app import snapshot, transform, webhooks
+from app.utils import jsonify, parse, get_request_base, get_links, cache_header
+from app.utils import get_mimetype, gen_date_windows
+from app.jobs import get_queue
 
-q = Queue(connection=conn)
 blueprint = Blueprint("API", __name__)
 
 # these don't change based on mode, so no need to do app.config['...']
@@ -70,23 +71,69 @@ PRICECLOSER_HEADERS = {
 HEADERS = {"Accept": "application/json"}
 SOURCE = "pricecloser.com"
 
+# the fields Cloze uses to find the person to update
+CUSTOMER_ID_FIELDS = ["direct", "name", "emails", "appLinks"]
+
 SHARE_TO_TEAMS = Config.SHARE_TO_TEAMS
 ROUTE_TIMEOUT = Config.ROUTE_TIMEOUT
 SET_TIMEOUT = Config.SET_TIMEOUT
 LRU_CACHE_SIZE = Config.LRU_CACHE_SIZE
+RECONCILE_PAGE_SIZE = Config.RECONCILE_PAGE_SIZE
+SYNC_SLEEP = Config.SYNC_SLEEP
+CUSTOMER_LOCK_TTL = Config.CUSTOMER_LOCK_TTL
+CUSTOMER_LOCK_WAIT = Config.CUSTOMER_LOCK_WAIT
+HANDOFF_BUDGET = Config.HANDOFF_BUDGET
+RESULTS_MAX_JOBS = Config.RESULTS_MAX_JOBS
+
+RESULT_STATUS_CODES = {
+    "queued": 202,
+    "started": 202,
+    "deferred": 202,
+    "scheduled": 202,
+    "finished": 200,
+    "failed": 500,
+    "job not found": 404,
+}
+EXPORT_WINDOW_DAYS = Config.EXPORT_WINDOW_DAYS
+QUEUE_STATS_TTL = Config.QUEUE_STATS_TTL
+QUEUE_PAGE_SIZE = Config.QUEUE_PAGE_SIZE
+QUEUE_MAX_PAGE_SIZE = Config.QUEUE_MAX_PAGE_SIZE
 
 share_to = import_to = "team" if SHARE_TO_TEAMS else ""
+sessions = {}
+UPSTREAM_HEADERS = {"cloze": HEADERS, "pricecloser": PRICECLOSER_HEADERS}
+
 
+def get_session(upstream):
+    # reuse connections (and TLS handshakes) across orders and jobs
+    if upstream not in sessions:
+        session = breaker.Session(upstream)
+        session.headers.update(UPSTREAM_HEADERS[upstream])
+        session.hooks["response"].append(instrument.get_response_hook(upstream))
+        session.hooks["response"].append(planner.response_hook)
+        sessions[upstream] = session
 
+    return sessions[upstream]
+
+
+@instrument.timed("post_to_cloze")
 def post_to_cloze(resource, verb, headers=None, **kwargs):
     url = f"{CLOZE_BASE_URL}/{resource}/{verb}"
     name = kwargs["name"]
     headers = headers or {}
+    plan = planner.get_plan()
+
+    if plan:
+        plan.record(resource, verb, kwargs)
+        message = f"Planned to {verb} {resource} '{name}'."
+        return {"ok": True, "message": message, "status_code": 200, "result": kwargs}
 
     params = {**CLOZE_AUTH_PARAMS, "team": str(SHARE_TO_TEAMS).lower()}
-    request_headers = {**HEADERS, **headers, "Content-Type": "application/json"}
+    request_headers = {**headers, "Content-Type": "application/json"}
     data = json.dumps(kwargs)
-    r = requests.post(url, data=data, params=params, headers=request_headers)
+    r = get_session("cloze").post(
+        url, data=data, params=params, headers=request_headers
+    )
     resp = r.json()
     okay = not resp["errorcode"]
 
@@ -108,11 +155,19 @@ def post_to_cloze(resource, verb, headers=None, **kwargs):
     }
 
 
+@instrument.timed("get_from_cloze")
 def get_from_cloze(resource, result_field, **kwargs):
     url = f"{CLOZE_BASE_URL}/{resource}/get"
     name = kwargs["uniqueid"]
+    planned = planner.lookup(resource, name)
+
+    if planned:
+        # the plan would have created it by now
+        message = f"Planned {resource} '{name}' found!"
+        return {"ok": True, "message": message, "result": planned, "status_code": 200}
+
     params = {**CLOZE_AUTH_PARAMS, **kwargs}
-    r = requests.get(url, params=params)
+    r = get_session("cloze").get(url, params=params)
     resp = r.json()
     okay = not resp["errorcode"]
 
@@ -134,10 +189,37 @@ def get_from_cloze(resource, result_field, **kwargs):
     }
 
 
+@instrument.timed("find_in_cloze")
+def find_in_cloze(resource, result_field, **kwargs):
+    url = f"{CLOZE_BASE_URL}/{resource}/find"
+    params = {**CLOZE_AUTH_PARAMS, **kwargs}
+    r = get_session("cloze").get(url, params=params)
+    resp = r.json()
+    okay = not resp["errorcode"]
+
+    if okay:
+        result = resp.get(result_field, [])
+        message = f"Successfully found {len(result)} {resource}!"
+        status_code = 200
+    else:
+        message = f"Error trying to find {resource}. "
+        message += resp["message"]
+        result = []
+        status_code = 500 if r.status_code == 200 else r.status_code
+
+    return {
+        "ok": okay,
+        "message": message,
+        "result": result,
+        "status_code": status_code,
+    }
+
+
+@instrument.timed("gen_manufacturers")
 def gen_manufacturers(products):
     for product in products:
         product_url = f"{PRICECLOSER_BASE_URL}/products/{product['product_id']}"
-        r = requests.get(product_url, headers=PRICECLOSER_HEADERS)
+        r = get_session("pricecloser").get(product_url)
         resp = r.json()
 
         if not resp["error"]:
@@ -377,7 +459,29 @@ def add_customer(pricecloser_order):
     return response
 
 
+def counted(hit):
+    # feeds the index hit ratio in `/metrics`
+    instrument.count("index_hit" if hit else "index_miss")
+    return hit
+
+
+def get_project_id(cloze_order):
+    return f"{SOURCE}:{cloze_order['name']}"
+
+
+def get_person_id(customer, email):
+    return f"direct:{customer['direct']}" if customer.get("direct") else email
+
+
 def add_order(pricecloser_order, customer):
+    order_id = str(pricecloser_order["order_id"])
+    email = pricecloser_order["email"]
+
+    if customer and counted(index.is_linked(order_id, email)):
+        # the order exists and is linked to the customer (as of the last sync)
+        message = f"Order '{order_id}' is already linked to '{customer['name']}'."
+        return {"ok": True, "message": message, "result": {"name": order_id}}
+
     # check if order exists, create if doesn't
     order_response = get_cloze_order(pricecloser_order)
     okay = order_response["ok"]
@@ -386,17 +490,16 @@ def add_order(pricecloser_order, customer):
         # make sure customer was added to order, add if not
         possible_ids = {
             f"direct:{customer.get('direct')}",
-            pricecloser_order["email"],
+            email,
             f"{SOURCE}:{get_customer_id(pricecloser_order)[0]}",
         }
 
-        for field in order_response["result"].get("customFields", []):
-            customer_link = CLOZE_ACCOUNT_MAP["customer_link"]
+        fields_by_id = get_fields_by_id(order_response["result"])
+        customer_link = fields_by_id.get(CLOZE_ACCOUNT_MAP["customer_link"], {})
+        linked_ids = set(customer_link.get("value", {}).get("ids", []))
 
-            if field["id"] == customer_link:
-                if possible_ids.intersection(field["value"]["ids"]):
-                    response = order_response
-                    break
+        if possible_ids & linked_ids:
+            response = order_response
         else:
             order_data = customer_to_order_data(pricecloser_order, customer)
             response = update_order(**order_data)
@@ -413,54 +516,238 @@ def add_order(pricecloser_order, customer):
     return response
 
 
-def add_order_to_customer(cloze_order, customer):
-    # check if order is attached to cloze customer, attach if not
-    order_name = cloze_order["name"]
-    custom_fields = customer.get("customFields", [])
-    pairs = enumerate(custom_fields)
-    fields_by_id = {field["id"]: (pos, field) for pos, field in pairs}
-    pos, orders = fields_by_id.get(CLOZE_ACCOUNT_MAP["orders_link"], (0, {}))
-    message = ""
+def get_fields_by_id(record):
+    return {field["id"]: field for field in record.get("customFields") or []}
 
-    if orders:
-        unique_order_id = f"{SOURCE}:{order_name}"
 
-        for attached_order in orders["value"]:
-            contains_order_id = unique_order_id in attached_order["ids"]
-            same_order_name = order_name == attached_order["name"]
+def get_field_values(field):
+    # multi-valued fields are created with a single value (see `get_order_data`)
+    values = field.get("value") or []
+    return [values] if isinstance(values, dict) else values
 
-            if contains_order_id or same_order_name:
-                contains_order = True
-                break
-        else:
-            contains_order = False
-    else:
-        contains_order = False
 
-    if orders and not contains_order:
-        order_value = get_order_value(cloze_order)
-        customer["customFields"][pos]["value"].append(order_value)
-    elif not orders:
-        order_data = get_order_data(cloze_order)
+def get_linked_order_ids(orders_field):
+    # names and unique ids of the orders linked to a customer, so that checking
+    # for an order is a set lookup
+    linked_ids = set()
+
+    for linked_order in get_field_values(orders_field):
+        linked_ids.add(linked_order["name"])
+        linked_ids.update(linked_order["ids"])
+
+    return linked_ids
+
 
-        if not customer.get("customFields"):
-            customer["customFields"] = []
+def get_customer_delta(customer, orders_field):
+    # Only send what identifies the customer and the orders field. Cloze
+    # replaces a custom field's whole value, so the field has to carry the
+    # existing links along with the new one.
+    delta = {key: customer[key] for key in CUSTOMER_ID_FIELDS if customer.get(key)}
+    delta["customFields"] = [orders_field]
+    delta["shareTo"] = share_to
+    return delta
 
-        customer["customFields"].append(order_data)
 
-    if not contains_order:
-        customer["shareTo"] = share_to
-        response = update_customer(**customer)
-        contains_order = response["ok"]
+def add_orders_to_customer(cloze_orders, customer, email=None):
+    # check if the orders are attached to the cloze customer, attach if not
+    if email:
+        has_order = lambda o: counted(index.has_order(email, o["name"]))
+        cloze_orders = list(filterfalse(has_order, cloze_orders))
+
+    if not cloze_orders:
+        return {"ok": True, "message": ""}
+
+    fields_by_id = get_fields_by_id(customer)
+    orders_field = fields_by_id.get(CLOZE_ACCOUNT_MAP["orders_link"])
+    linked_ids = get_linked_order_ids(orders_field) if orders_field else set()
+    message = ""
+
+    missing = [
+        cloze_order
+        for cloze_order in cloze_orders
+        if not {cloze_order["name"], f"{SOURCE}:{cloze_order['name']}"} & linked_ids
+    ]
+
+    if email and linked_ids and not planner.is_planning():
+        linked_names = (v["name"] for v in get_field_values(orders_field))
+        index.add_orders(email, *linked_names)
+
+    if orders_field and missing:
+        order_values = get_field_values(orders_field)
+        orders_field["value"] = order_values + list(map(get_order_value, missing))
+    elif missing:
+        orders_field = get_order_data(missing[0])
+        customer.setdefault("customFields", []).append(orders_field)
+
+        if missing[1:]:
+            orders_field["value"] = list(map(get_order_value, missing))
+
+    if missing:
+        # a single update links all of the customer's new orders
+        delta = get_customer_delta(customer, orders_field)
+        response = update_customer(**delta)
+        contains_orders = response["ok"]
         message = response["message"]
 
         if not response["ok"]:
             message += " Please add order manually."
+    else:
+        contains_orders = True
+
+    return {"ok": contains_orders, "message": message}
+
+
+def add_order_to_customer(cloze_order, customer, email=None):
+    return add_orders_to_customer([cloze_order], customer, email)
+
+
+def gen_customer_orders(pricecloser_orders):
+    """ Groups orders by customer (in order of each customer's first order)
+
+    >>> first, guest = {"customer_id": "1", "email": "a"}, {"customer_id": "0"}
+    >>> orders = [first, {**guest, "email": "b"}, first]
+    >>> [len(customer_orders) for customer_orders in gen_customer_orders(orders)]
+    [2, 1]
+    """
+    customer_orders = {}
+    columns = transform.get_columns(pricecloser_orders, ["customer_id", "email"])
+    emails = columns["email"]
+    customer_ids, _ = transform.get_customer_ids(columns["customer_id"], emails)
+
+    # Cloze finds people by email, so a customer whose email changed between
+    # orders is treated as two customers (as when synced singly)
+    keys = zip(customer_ids, emails)
+
+    for key, pricecloser_order in zip(keys, pricecloser_orders):
+        customer_orders.setdefault(key, []).append(pricecloser_order)
+
+    yield from customer_orders.values()
+
+
+def is_synced(pricecloser_order):
+    order_id = str(pricecloser_order["order_id"])
+    return counted(index.is_synced(order_id, pricecloser_order["email"]))
+
 
-    return {"ok": contains_order, "message": message}
+def get_sleep(sleep):
+    # planned sleeps take no time
+    return 0 if planner.is_planning() else sleep
+
+
+def skip_orders(customer_orders, num_synced=0, sleep=0, skip_response=None):
+    """ Reports the orders left once the budget ran out (see `app.budget`). In a
+    job, the orders are deferred to new jobs.
+
+    Args:
+        customer_orders (List[List[dict]]): The skipped orders of each customer
+        num_synced (int): The number of orders synced before the budget ran out
+        skip_response (dict): An earlier `skip_orders` response to add to
+    """
+    from rq import get_current_job
+
+    skip_response = skip_response or {}
+    skipped = skip_response.get("skipped", [])
+    skipped += [str(o["order_id"]) for o in chain.from_iterable(customer_orders)]
+    message = f"Ran out of time after syncing {num_synced} orders, so "
+    response = {
+        "ok": False,
+        "status_code": 504,
+        "budget_exhausted": True,
+        "skipped": skipped,
+    }
+
+    if get_current_job() and not planner.is_planning():
+        job_ids = skip_response.get("deferred", [])
+        job_ids += [
+            jobs.enqueue(
+                add_customer_and_orders, list(map(jobs.trim_order, orders)), sleep
+            ).id
+            for orders in customer_orders
+        ]
+
+        message += f"deferred {len(skipped)} orders to {len(job_ids)} jobs."
+        response.update({"ok": True, "status_code": 202, "deferred": job_ids})
+    else:
+        message += f"skipped {len(skipped)} orders."
+
+    response["message"] = message
+    return response
 
 
 def add_customer_and_order(pricecloser_order, sleep=0):
+    return add_customer_and_orders([pricecloser_order], sleep)
+
+
+def add_customer_and_orders(pricecloser_orders, sleep=0):
+    """ Syncs the orders of a single customer (see `gen_customer_orders`)
+    """
+    unsynced = list(filterfalse(is_synced, pricecloser_orders))
+
+    if len(pricecloser_orders) == 1 and not unsynced:
+        order_id = pricecloser_orders[0]["order_id"]
+        message = f"Order '{order_id}' is already synced to Cloze."
+        return {"ok": True, "message": message}
+    elif not unsynced:
+        message = f"All {len(pricecloser_orders)} orders are already synced to Cloze."
+        return {"ok": True, "message": message}
+
+    email = unsynced[0]["email"]
+
+    # Workers syncing orders of the same customer would overwrite each other's
+    # order links (see `app.locks`), so they take turns. A turn covers all of
+    # the customer's orders, so the lock lasts longer the more there are.
+    wait = budget.clamp(CUSTOMER_LOCK_WAIT)
+    ttl = CUSTOMER_LOCK_TTL * len(unsynced) + sleep
+
+    with locks.customer_lock(email, ttl, wait) as locked:
+        if locked:
+            try:
+                response = sync_customer_and_orders(unsynced, sleep)
+            except budget.BudgetExhausted:
+                # orders added before the budget ran out only count as synced
+                # once they're linked (a resync finds them in Cloze)
+                response = skip_orders([unsynced], sleep=sleep)
+        elif wait < CUSTOMER_LOCK_WAIT:
+            # the budget (rather than the other sync) ended the wait, so skip
+            # (or defer) the orders like any others left once it runs out
+            response = skip_orders([unsynced], sleep=sleep)
+        else:
+            message = f"Timed out waiting for other orders of '{email}' to sync."
+            response = {"ok": False, "message": message, "status_code": 409}
+
+    return response
+
+
+def add_orders(pricecloser_orders, customer, sleep=0):
+    """ Adds a customer's orders to Cloze (up to the first that fails)
+
+    Returns:
+        (tuple): The added (PriceCloser order, Cloze order) pairs and the
+            response that stopped the adding (or None)
+    """
+    added = []
+
+    for pos, pricecloser_order in enumerate(pricecloser_orders):
+        try:
+            order_response = add_order(pricecloser_order, customer)
+        except budget.BudgetExhausted:
+            # the orders added so far still get linked
+            return added, skip_orders([pricecloser_orders[pos:]], pos, sleep)
+
+        if order_response["ok"]:
+            added.append((pricecloser_order, order_response["result"]))
+        else:
+            return added, order_response
+
+    return added, None
+
+
+def sync_customer_and_orders(pricecloser_orders, sleep=0):
+    """
+    Raises:
+        BudgetExhausted: If the budget runs out before the orders are added
+            and linked
+    """
     ##################################################################
     # TODO: The Cloze system doesn't always update people and projects
     # before I call the `get person` or `get project` endpoints again.
@@ -469,25 +756,61 @@ def add_customer_and_order(pricecloser_order, sleep=0):
     # below has solved the problem, but a more elegant solution should
     # eventually be created.
     ##################################################################
-    time.sleep(sleep)
+    email = pricecloser_orders[0]["email"]
 
-    customer_response = add_customer(pricecloser_order)
+    if not budget.has(get_sleep(sleep)):
+        raise budget.BudgetExhausted()
 
-    if customer_response["ok"]:
-        customer = customer_response["result"]
-        order_response = add_order(pricecloser_order, customer)
+    with instrument.timer("sleep"):
+        planner.sleep(sleep)
 
-        if order_response["ok"]:
-            cloze_order = order_response["result"]
-            response = add_order_to_customer(cloze_order, customer)
-        else:
-            response = order_response
-    else:
-        response = customer_response
+    customer_response = add_customer(pricecloser_orders[0])
+
+    if not customer_response["ok"]:
+        return customer_response
+
+    customer = customer_response["result"]
+    person_id = get_person_id(customer, email)
+    added, response = add_orders(pricecloser_orders, customer, sleep)
+
+    if added:
+        cloze_orders = [cloze_order for _, cloze_order in added]
+        link_response = add_orders_to_customer(cloze_orders, customer, email)
+
+        if link_response["ok"] and not planner.is_planning():
+            for pricecloser_order, cloze_order in added:
+                order_id = str(pricecloser_order["order_id"])
+                project_id = get_project_id(cloze_order)
+                index.record_sync(order_id, email, project_id, person_id)
+                instrument.count("orders_synced")
+
+        if response is None or not link_response["ok"]:
+            response = link_response
 
     return response
 
 
+def get_snapshot_orders(start_date, end_date):
+    """ Gets the stored orders for the settled part of a date range
+
+    Returns:
+        (tuple): The stored orders and the date from which orders still need to
+            be fetched
+    """
+    store = snapshot.get_store()
+    covered_date = store.get_covered_date(start_date) if store else None
+
+    if covered_date:
+        stored_date = min(end_date, covered_date)
+        orders = store.get_range(start_date, stored_date)
+        fetch_date = stored_date + timedelta(days=1)
+    else:
+        orders, fetch_date = [], start_date
+
+    return orders, fetch_date
+
+
+@instrument.timed("get_pc_orders")
 def get_pc_orders(order_id=None, start=None, end=None):
     if order_id:
         order_url = f"{PRICECLOSER_BASE_URL}/orders/{order_id}"
@@ -500,14 +823,28 @@ def get_pc_orders(order_id=None, start=None, end=None):
         pricecloser_end = (next_day).strftime(DATE_FORMAT)
 
         if not start:
-            default_start = cache.get("next_start_date")
+            default_start = scheduler.get_next_start_date()
             num_months_back = app.config["REPORT_MONTHS"]
             args = (end_date, num_months_back)
             start = default_start or get_start_date(*args).strftime(DATE_FORMAT)
 
-        order_url = f"{PRICECLOSER_BASE_URL}/orders/details/added_from/{start}/added_to/{pricecloser_end}"
+        start_date = datetime.strptime(start, DATE_FORMAT).date()
+        stored_orders, fetch_date = get_snapshot_orders(start_date, end_date.date())
+        fetch_start = fetch_date.strftime(DATE_FORMAT)
+
+        if fetch_date > end_date.date():
+            return {
+                "ok": True,
+                "result": stored_orders,
+                "message": f"Orders from {start} to {end} found in the snapshot!",
+                "status_code": 200,
+                "end_date": end_date,
+            }
+
+        order_url = f"{PRICECLOSER_BASE_URL}/orders/details/added_from/{fetch_start}"
+        order_url += f"/added_to/{pricecloser_end}"
 
-    r = requests.get(order_url, headers=PRICECLOSER_HEADERS)
+    r = get_session("pricecloser").get(order_url)
     resp = r.json()
     result = resp["data"]
     okay = not resp["error"]
@@ -518,11 +855,19 @@ def get_pc_orders(order_id=None, start=None, end=None):
         message = f"Successfully added order '{order_id}'"
         message += f" and customer '{first_name} {last_name}' to Cloze. "
     elif okay:
-        message = "Orders from {start} to {pricecloser_end} found in PriceCloser!"
+        message = f"Orders from {start} to {pricecloser_end} found in PriceCloser!"
     else:
         message = "Order could not be found in PriceCloser: "
         message += resp["error"][0]
 
+    if okay and not order_id:
+        store = snapshot.get_store()
+
+        if store:
+            store.save(result, fetch_date, end_date.date())
+
+        result = stored_orders + result
+
     if okay:
         status_code = 200
     elif r.status_code == 200:
@@ -539,65 +884,383 @@ def get_pc_orders(order_id=None, start=None, end=None):
     }
 
 
+def gen_pc_orders(start=None, end=None, days=EXPORT_WINDOW_DAYS):
+    """ Generates a range of PriceCloser orders. The orders are fetched `days`
+    at a time so that only one window of orders is ever in memory.
+    """
+    end_date = datetime.strptime(end, DATE_FORMAT).date() if end else date.today()
+    num_months_back = app.config["REPORT_MONTHS"]
+
+    if start:
+        start_date = datetime.strptime(start, DATE_FORMAT).date()
+    else:
+        start_date = get_start_date(end_date, num_months_back)
+
+    for window in gen_date_windows(start_date, end_date, days):
+        window_start, window_end = (d.strftime(DATE_FORMAT) for d in window)
+        order_response = get_pc_orders(start=window_start, end=window_end)
+
+        if not order_response["ok"]:
+            raise RuntimeError(order_response["message"])
+
+        yield from order_response["result"]
+
+
+def get_project_key(cloze_project):
+    for app_link in cloze_project.get("appLinks", []):
+        if app_link.get("source") == SOURCE:
+            return f"{SOURCE}:{app_link['uniqueid']}"
+
+
+def get_cloze_projects(pagesize=RECONCILE_PAGE_SIZE):
+    """ Pages through all Cloze projects and indexes the PriceCloser ones by
+    `SOURCE:order_id`. Only the fields needed to reconcile are kept.
+    """
+    projects = {}
+    customer_link = CLOZE_ACCOUNT_MAP["customer_link"]
+    team = str(SHARE_TO_TEAMS).lower()
+
+    for pagenumber in count(1):
+        kwargs = {"pagesize": pagesize, "pagenumber": pagenumber, "team": team}
+        response = find_in_cloze("projects", "projects", **kwargs)
+
+        if not response["ok"]:
+            return response
+
+        for cloze_project in response["result"]:
+            key = get_project_key(cloze_project)
+
+            if key:
+                projects[key] = {
+                    "stage": cloze_project.get("stage"),
+                    "linked": customer_link in get_fields_by_id(cloze_project),
+                }
+
+        if len(response["result"]) < pagesize:
+            break
+
+    message = f"Found {len(projects)} PriceCloser projects in Cloze."
+    return {"ok": True, "message": message, "result": projects, "status_code": 200}
+
+
+def diff_orders(pricecloser_orders, cloze_projects):
+    diff = {"missing": [], "stage_mismatches": [], "missing_links": []}
+
+    for pricecloser_order in pricecloser_orders:
+        cloze_project = cloze_projects.get(f"{SOURCE}:{pricecloser_order['order_id']}")
+        stage = get_stage(get_order_status(pricecloser_order), "projects")
+
+        if not cloze_project:
+            diff["missing"].append(pricecloser_order)
+            continue
+
+        if not cloze_project["linked"]:
+            diff["missing_links"].append(pricecloser_order)
+
+        if cloze_project["stage"] != stage:
+            diff["stage_mismatches"].append(pricecloser_order)
+
+    return diff
+
+
+def update_order_stage(pricecloser_order):
+    order_status = get_order_status(pricecloser_order)
+    order_id = str(pricecloser_order["order_id"])
+    url = f"{PRICECLOSER_APPLINK_BASE_URL}sale/order/info&order_id={order_id}"
+
+    order_data = {
+        "importTo": import_to,
+        "name": order_id,
+        "stage": get_stage(order_status, "projects"),
+        "appLinks": [
+            {
+                "source": SOURCE,  # must always be the same
+                "uniqueid": order_id,
+                "label": "PriceCloser Order",
+                "url": url,
+            }
+        ],
+    }
+
+    return update_order(**order_data)
+
+
+def sync_order(order_id, event="order.created"):
+    """ Syncs a single order (e.g., after a PriceCloser notification). Since
+    existing orders are otherwise left alone, updated orders also get their
+    stage updated.
+    """
+    order_response = get_pc_orders(order_id)
+
+    if order_response["ok"]:
+        pricecloser_order = order_response["result"]
+        response = add_customer_and_order(pricecloser_order)
+
+        if response["ok"] and event == "order.updated":
+            response = update_order_stage(pricecloser_order)
+    else:
+        response = order_response
+
+    return {**response, "order_id": str(order_id)}
+
+
+def reconcile_orders(start=None, end=None, enqueue=True):
+    """ Compares a range of PriceCloser orders against the projects in Cloze, and
+    enqueues (or returns) only the orders that need repair
+    """
+    end = end or date.today().strftime(DATE_FORMAT)
+    end_date = datetime.strptime(end, DATE_FORMAT)
+    start = start or get_start_date(end_date, Config.REPORT_MONTHS).strftime(
+        DATE_FORMAT
+    )
+    order_response = get_pc_orders(start=start, end=end)
+
+    if not order_response["ok"]:
+        return order_response
+
+    project_response = get_cloze_projects()
+
+    if not project_response["ok"]:
+        return project_response
+
+    diff = diff_orders(order_response["result"], project_response["result"])
+    response = {
+        key: [str(order["order_id"]) for order in orders]
+        for key, orders in diff.items()
+    }
+
+    # the index would otherwise short circuit the repairs
+    index.forget(*response["missing"], *response["missing_links"])
+    repairs = [
+        (add_customer_and_order, diff["missing"] + diff["missing_links"]),
+        (update_order_stage, diff["stage_mismatches"]),
+    ]
+
+    num_repairs = sum(len(orders) for _, orders in repairs)
+    num_orders = len(order_response["result"])
+
+    if enqueue:
+        for func, orders in repairs:
+            for pricecloser_order in orders:
+                jobs.enqueue(func, jobs.trim_order(pricecloser_order), queue="low")
+
+    verb = "Enqueued" if enqueue else "Found"
+    message = f"{verb} {num_repairs} repairs for {num_orders} orders "
+    message += f"from {start} to {end}."
+    response.update({"ok": True, "message": message, "status_code": 200})
+    return response
+
+
 def get_job_response(job):
+    job_status = job.get_status()
+
     return {
         "job_id": job.id,
-        "job_status": job.get_status(),
+        "job_status": job_status,
         # TODO: this doesn't list the port in when run without app context
         "url": url_for(".result", job_id=job.id, _external=True),
-        "ok": job.get_status() is not "failed",
+        "ok": job_status != "failed",
     }
 
 
+def get_result_response(job_id):
+    job = get_queue().fetch_job(job_id)
+
+    if job:
+        job_status = job.get_status()
+        job_result = job.result
+    else:
+        job_status = "job not found"
+        job_result = {}
+
+    return {
+        "status_code": RESULT_STATUS_CODES[job_status],
+        "job_id": job_id,
+        "job_status": job_status,
+        "result": job_result,
+    }
+
+
+def plan_orders(order_id=None, start=None, end=None, **kwargs):
+    """ Computes the Cloze writes `transfer_orders` would make (without making
+    them or sleeping between orders). If the budget runs out, the plan covers
+    the orders before the `skipped` ones.
+    """
+    kwargs = {**kwargs, "plan": False, "enqueue": False}
+
+    with planner.planning() as plan:
+        response = transfer_orders(order_id, start, end, **kwargs)
+
+    if response["ok"] or response.get("budget_exhausted"):
+        summary = plan.summarize()
+        message = f"Planned {summary['num_writes']} Cloze writes in "
+        message += f"{summary['num_calls']} calls (~{summary['est_seconds']}s)."
+
+        if response.get("budget_exhausted"):
+            num_skipped = len(response["skipped"])
+            message += f" Ran out of time before planning {num_skipped} orders."
+            response.update({"ok": True, "status_code": 200})
+
+        response.update({"message": message, "result": summary})
+
+    return response
+
+
 def transfer_orders(order_id=None, start=None, end=None, **kwargs):
     """ NOTE: The REST Admin API is not inclusive of the end date that a person sends,
     so one day is added to the `end` parameter to make this endpoint inclusive.
+
+    Kwargs:
+        plan (bool): Only compute the Cloze writes (see `plan_orders`).
+        handoff (bool): Continue the sync as an rq job once the time budget
+            runs out (see `hand_off`).
+        shards (int): Split the range into this many date windows, each synced
+            by its own job (see `app.backfill`).
     """
+    if kwargs.get("plan"):
+        return plan_orders(order_id, start, end, **kwargs)
+    elif kwargs.get("shards") and not order_id:
+        sleep = kwargs.get("sleep", SYNC_SLEEP)
+        response = backfill.start_backfill(start, end, kwargs["shards"], sleep)
+        backfill_id = response["backfill_id"]
+        url = url_for(".backfill_status", backfill_id=backfill_id, _external=True)
+        return {**response, "url": url, "status_code": 202}
+
     # If a date range is provided as parameters to this endpoint (start and end),
-    # then the dates will not be set in the cache. This is because a date range may
-    # be specified that doesn't bring in orders that were created earlier than this
-    # date range, and if the cache was set to start after the specified date range,
-    # this endpoint would never bring in the older orders.
-    order_response = get_pc_orders(order_id, start, end)
+    # then the `next_start_date` watermark is not advanced. This is because a date
+    # range may be specified that doesn't bring in orders that were created earlier
+    # than this date range, and if the watermark was set to start after the specified
+    # date range, this endpoint would never bring in the older orders.
     enqueue = kwargs.get("enqueue")
+    sleep = kwargs.get("sleep", SYNC_SLEEP)
+
+    try:
+        order_response = get_pc_orders(order_id, start, end)
+    except budget.BudgetExhausted:
+        # plans have nothing to hand off
+        if not kwargs.get("handoff") or planner.is_planning():
+            raise
+
+        return hand_off_fetch(order_id, start, end, sleep)
 
     if order_response["ok"]:
         result = order_response["result"]
+        end_date = None if (order_id or end or start) else order_response["end_date"]
 
         if order_id and enqueue:
-            job = q.enqueue(add_customer_and_order, result)
+            job = jobs.enqueue(add_customer_and_order, jobs.trim_order(result))
             response = get_job_response(job)
         elif order_id:
             response = add_customer_and_order(result)
         else:
-            num_orders = len(result)
-            response = {}
-
-            for pricecloser_order in result:
-                if enqueue:
-                    job = q.enqueue(add_customer_and_order, pricecloser_order, 10)
-                    response = get_job_response(job)
-                else:
-                    response = add_customer_and_order(pricecloser_order, 10)
-
-                if not response["ok"]:
-                    break
-            else:
-                # TODO: think about tracking by order number in the future so
-                # we don't have to rerun a whole batch of successful orders if
-                # one fails.
-                verb = "enqueued" if enqueue else "added"
-                message = f"Successfully {verb} {num_orders} orders to Cloze."
-                response["message"] = message
-
-            if not (end or start):
-                cache.set("next_start_date", order_response["end_date"])
+            response = sync_orders(result, sleep, enqueue, end_date)
+
+        if kwargs.get("handoff") and response.get("budget_exhausted"):
+            orders = [result] if order_id else result
+            response = hand_off(response, orders, 0 if order_id else sleep, end_date)
     else:
         response = order_response
 
     return response
 
 
+def sync_orders(pricecloser_orders, sleep=SYNC_SLEEP, enqueue=False, end_date=None):
+    """ Syncs (or enqueues a job for) the orders of each customer
+
+    Args:
+        end_date (datetime): Once every order made it, advance the
+            `next_start_date` watermark to this date.
+    """
+    num_orders = len(pricecloser_orders)
+    response = {}
+    num_synced = 0
+    customer_groups = list(gen_customer_orders(pricecloser_orders))
+
+    # each customer's person is looked up and updated once
+    for pos, customer_orders in enumerate(customer_groups):
+        # the sleep gives Cloze time to catch up between customers, so the
+        # first one goes right away (otherwise a handoff budget no longer than
+        # the sleep would hand off every order)
+        customer_sleep = sleep if pos else 0
+
+        if not (enqueue or budget.has(get_sleep(customer_sleep))):
+            skipped = customer_groups[pos:]
+            response = skip_orders(skipped, num_synced, sleep)
+            break
+        elif enqueue:
+            args = (list(map(jobs.trim_order, customer_orders)), sleep)
+            job = jobs.enqueue(add_customer_and_orders, *args)
+            response = get_job_response(job)
+        else:
+            response = add_customer_and_orders(customer_orders, customer_sleep)
+
+        if response.get("budget_exhausted"):
+            # add the customers after this one to the skipped orders
+            num_synced += len(customer_orders) - len(response["skipped"])
+            args = (customer_groups[pos + 1 :], num_synced, sleep)
+            response = skip_orders(*args, response)
+            break
+        elif not response["ok"]:
+            break
+
+        num_synced += len(customer_orders)
+    else:
+        # TODO: think about tracking by order number in the future so
+        # we don't have to rerun a whole batch of successful orders if
+        # one fails.
+        verb = "enqueued" if enqueue else "added"
+        message = f"Successfully {verb} {num_orders} orders to Cloze."
+        response["message"] = message
+
+        # only advance the watermark once every order made it
+        if end_date and not planner.is_planning():
+            scheduler.set_next_start_date(end_date)
+
+    return response
+
+
+def hand_off(skip_response, pricecloser_orders, sleep=0, end_date=None):
+    """ Continues a sync that ran out of (request) time as an rq job
+
+    Args:
+        skip_response (dict): The `skip_orders` response of the sync
+        pricecloser_orders (List[dict]): The orders of the sync
+        end_date (datetime): The watermark to set once every order made it
+    """
+    # jobs already defer their skipped orders and plans have nothing to hand off
+    if "deferred" in skip_response or planner.is_planning():
+        return skip_response
+
+    skipped = set(skip_response["skipped"])
+    remaining = [
+        jobs.trim_order(pricecloser_order)
+        for pricecloser_order in pricecloser_orders
+        if str(pricecloser_order["order_id"]) in skipped
+    ]
+
+    # rq's default timeout (3 minutes) would kill a large handoff, so leave each
+    # order the time its customer's lock allows
+    job_timeout = len(remaining) * (sleep + CUSTOMER_LOCK_TTL)
+    args = (sync_orders, remaining, sleep, False, end_date)
+    job = jobs.enqueue(*args, job_timeout=job_timeout)
+    num_synced = len(pricecloser_orders) - len(remaining)
+    message = f"Ran out of time after syncing {num_synced} orders, so handed off "
+    message += f"the other {len(remaining)} to job {job.id}."
+    response = {**get_job_response(job), "message": message, "status_code": 202}
+    response["skipped"] = skip_response["skipped"]
+    return response
+
+
+def hand_off_fetch(order_id=None, start=None, end=None, sleep=SYNC_SLEEP):
+    """ Continues a sync whose PriceCloser fetch ran out of (request) time as an
+    rq job (e.g., a large range)
+    """
+    job = jobs.enqueue(transfer_orders, order_id, start, end, sleep=sleep)
+    message = "Ran out of time fetching the PriceCloser orders, so handed off the "
+    message += f"sync to job {job.id}."
+    return {**get_job_response(job), "message": message, "status_code": 202}
+
+
 ##################################################
 # This group of functions works with REPORT_MONTHS
 # to get the exact same day 'X' number of months ago.
@@ -638,6 +1301,34 @@ def get_start_date(end_date, num_months_back):
 ###########################################################################
 # ROUTES
 ###########################################################################
+@blueprint.before_request
+def start_instrumenting():
+    instrument.start_request()
+    budget.start_request()
+
+
+@blueprint.after_request
+def add_server_timing(response):
+    stats = instrument.get_stats()
+
+    if stats and (stats["upstreams"] or stats["timers"]):
+        response.headers["Server-Timing"] = instrument.get_server_timing(stats)
+        instrument.log_stats(stats, path=request.path, method=request.method)
+        metrics.record_stats(stats)
+
+    return response
+
+
+@blueprint.errorhandler(breaker.CircuitOpenError)
+def circuit_open(error):
+    return jsonify(status_code=503, message=str(error))
+
+
+@blueprint.errorhandler(budget.BudgetExhausted)
+def budget_exhausted(error):
+    return jsonify(status_code=504, message=str(error), budget_exhausted=True)
+
+
 @blueprint.route("/")
 @blueprint.route(PREFIX)
 def root():
@@ -649,6 +1340,18 @@ def root():
 
 
 class Order(MethodView):
+    def get_kwargs(self):
+        kwargs = {k: parse(v) for k, v in request.args.to_dict().items()}
+
+        # a sync that takes longer than the handoff budget continues as a job
+        # (plans and enqueued syncs have nothing to hand off)
+        inline = not (kwargs.get("plan") or kwargs.get("enqueue"))
+
+        if inline and kwargs.get("handoff", True):
+            budget.start_request(HANDOFF_BUDGET)
+
+        return kwargs
+
     def get(self, order_id):
         info = {
             "description": "Get a Cloze customer for a PriceCloser order",
@@ -668,14 +1371,14 @@ class Order(MethodView):
 
     def patch(self, order_id):
         info = {"description": "Transfer a PriceCloser order to Cloze"}
-        kwargs = {k: parse(v) for k, v in request.args.to_dict().items()}
+        kwargs = {"handoff": True, **self.get_kwargs()}
         response = transfer_orders(order_id, **kwargs)
         response.update(info)
         return jsonify(**response)
 
     def post(self, start=None, end=None):
         info = {"description": "Transfer PriceCloser orders to Cloze"}
-        kwargs = {k: parse(v) for k, v in request.args.to_dict().items()}
+        kwargs = {"handoff": True, **self.get_kwargs()}
         response = transfer_orders(start=start, end=end, **kwargs)
         response.update(info)
         return jsonify(**response)
@@ -687,34 +1390,209 @@ def result(job_id):
 
     Args:
         job_id (str): The job id.
+
+    Kwargs:
+        wait (float): Max seconds to wait for the job to finish (long-poll).
     """
-    job = q.fetch_job(job_id)
-    statuses = {
-        "queued": 202,
-        "started": 202,
-        "finished": 200,
-        "failed": 500,
-        "job not found": 404,
-    }
+    wait = request.args.get("wait", 0, type=float)
 
-    if job:
-        job_status = job.get_status()
-        job_result = job.result
+    if wait > 0:
+        progress.wait(job_id, wait)
+
+    response = get_result_response(job_id)
+    response["links"] = get_links(app.url_map.iter_rules())
+    return jsonify(**response)
+
+
+@blueprint.route(f"{PREFIX}/results", methods=["POST"])
+def results():
+    """ Displays the status (and compact result) of many jobs at once.
+
+    Kwargs:
+        job_ids (List[str]): The job ids (in the JSON body).
+        fields (List[str]): The fields to include (in the JSON body; default:
+            job_status and result). See `jobs.JOB_RESULT_FIELDS`.
+    """
+    body = request.get_json(silent=True) or {}
+    job_ids = body.get("job_ids")
+    fields = body.get("fields") or jobs.DEF_JOB_RESULT_FIELDS
+    lists = [job_ids, fields]
+    are_lists = all(isinstance(value, list) for value in lists)
+
+    if not (are_lists and all(isinstance(v, str) for v in chain(*lists))):
+        message = "Send the job ids (and any fields) as JSON lists, e.g., "
+        message += '{"job_ids": [...], "fields": ["job_status"]}.'
+        response = {"status_code": 400, "message": message}
+    elif len(job_ids) > RESULTS_MAX_JOBS:
+        message = f"Only {RESULTS_MAX_JOBS} jobs may be looked up at once."
+        response = {"status_code": 413, "message": message}
+    elif set(fields).difference(jobs.JOB_RESULT_FIELDS):
+        unknown = ", ".join(sorted(set(fields).difference(jobs.JOB_RESULT_FIELDS)))
+        valid = ", ".join(jobs.JOB_RESULT_FIELDS)
+        message = f"Unknown fields {unknown}. Try one of {valid}."
+        response = {"status_code": 400, "message": message}
     else:
-        job_status = "job not found"
-        job_result = {}
+        result = jobs.get_results(job_ids, fields)
+        response = {"result": result}
 
-    response = {
-        "status_code": statuses[job_status],
-        "job_id": job_id,
-        "job_status": job_status,
-        "result": job_result,
-        "links": get_links(app.url_map.iter_rules()),
-    }
+        if "job_status" in fields:
+            statuses = (job["job_status"] for job in result.values())
+            response["counts"] = dict(Counter(statuses))
+
+    return jsonify(**response)
+
+
+@blueprint.route(f"{PREFIX}/result/<string:job_id>/events")
+def result_events(job_id):
+    """ Streams a job's status changes (and then its result) as server-sent
+    events
+    """
+    # the stream lasts as long as the job
+    budget.lift()
+    events = progress.gen_events(job_id, get_result_response)
+    headers = {"Cache-Control": "no-cache"}
+    body = stream_with_context(events)
+    return app.response_class(body, mimetype="text/event-stream", headers=headers)
+
+
+@blueprint.route(f"{PREFIX}/backfill/<string:backfill_id>")
+def backfill_status(backfill_id):
+    """ Displays the progress of a sharded backfill (see `transfer_orders`)
+
+    Args:
+        backfill_id (str): The backfill id.
+    """
+    progress = backfill.get_progress(backfill_id)
+
+    if progress:
+        response = {"result": progress}
+    else:
+        message = f"Backfill '{backfill_id}' not found."
+        response = {"status_code": 404, "message": message}
+
+    response["links"] = get_links(app.url_map.iter_rules())
+    return jsonify(**response)
+
+
+@blueprint.route(f"{PREFIX}/metrics")
+def metrics_view():
+    """ Displays queue, job, upstream, and index metrics in the Prometheus text
+    format
+    """
+    text = metrics.render()
+
+    if text is None:
+        response = jsonify(status_code=503, message="Metrics are unavailable.")
+    else:
+        response = app.response_class(text, content_type=metrics.CONTENT_TYPE)
+
+    return response
+
+
+class Queues(MethodView):
+    # a short-lived cache so that refreshing the page doesn't add redis load
+    decorators = [cache_header(QUEUE_STATS_TTL, query_string=True)]
+
+    def get(self, name=None, registry="queued"):
+        info = {
+            "description": "Get rq queue stats (or one page of a queue's jobs)",
+            "links": get_links(app.url_map.iter_rules()),
+        }
+
+        if name and registry not in dashboard.REGISTRIES:
+            registries = ", ".join(dashboard.REGISTRIES)
+            message = f"Registry '{registry}' not found. Try one of {registries}."
+            response = {"status_code": 404, "message": message}
+        elif name:
+            page = max(request.args.get("page", 1, type=int), 1)
+            per_page = request.args.get("per_page", QUEUE_PAGE_SIZE, type=int)
+            per_page = min(max(per_page, 1), QUEUE_MAX_PAGE_SIZE)
+            result = dashboard.get_jobs(name, registry, page, per_page)
+            response = {"result": result}
+        else:
+            response = {"result": dashboard.get_summary()}
+
+        response.update(info)
+        return jsonify(**response)
+
+
+@blueprint.route(f"{PREFIX}/webhook/pricecloser", methods=["POST"])
+def pricecloser_webhook():
+    """ Enqueues a (high priority) sync of a created or updated PriceCloser order
+
+    Kwargs:
+        event (str): Either `order.created` or `order.updated`.
+        order_id (str): The order id.
+        timestamp (str): When the order was created or updated (used to ignore
+            duplicate notifications).
+    """
+    signature = request.headers.get(webhooks.SIGNATURE_HEADER)
+    data = request.get_json(silent=True) or {}
+    event = data.get("event")
+    order_id = data.get("order_id")
+    timestamp = data.get("timestamp") or data.get("date_modified")
+
+    if not webhooks.PRICECLOSER_WEBHOOK_SECRET:
+        response = {"status_code": 503, "message": "No webhook secret is set."}
+    elif not webhooks.verify(request.get_data(), signature):
+        response = {"status_code": 401, "message": "Invalid signature."}
+    elif event not in webhooks.EVENTS or not (order_id and timestamp):
+        message = "An event, order_id, and timestamp are required."
+        response = {"status_code": 400, "message": message}
+    elif webhooks.claim(order_id, timestamp):
+        # claiming first keeps concurrent duplicates from both enqueueing
+        try:
+            job = jobs.enqueue(sync_order, str(order_id), event, queue="high")
+        except Exception:
+            webhooks.release(order_id, timestamp)
+            raise
+
+        response = {**get_job_response(job), "status_code": 202}
+    else:
+        message = f"Already received {event} for order '{order_id}' at {timestamp}."
+        response = {"message": message}
 
     return jsonify(**response)
 
 
+class Export(MethodView):
+    def get(self, resource, start=None, end=None):
+        """ Streams PriceCloser orders or the sync ledger (the synced orders
+        and their Cloze ids) as CSV or NDJSON (depending on the `Accept`
+        header)
+
+        Kwargs:
+            days (int): Number of days of orders to fetch at a time.
+        """
+        mimetype = get_mimetype(request, export.EXPORT_MIMETYPES)
+        mimetype = mimetype if mimetype in export.EXPORT_MIMETYPES else export.CSV
+        # a quality of 0 (e.g., `gzip;q=0`) refuses the encoding
+        gzip = request.accept_encodings["gzip"] > 0
+
+        # the router only limits the time to the first byte of a stream
+        budget.lift()
+
+        if resource == "orders":
+            days = request.args.get("days", EXPORT_WINDOW_DAYS, type=int)
+            orders = gen_pc_orders(start, end, max(days, 1))
+
+            # fail before streaming if PriceCloser can't be reached at all
+            try:
+                first = list(islice(orders, 1))
+            except RuntimeError as e:
+                return jsonify(status_code=502, message=str(e))
+
+            records = map(export.get_order_row, chain(first, orders))
+            fields = export.ORDER_EXPORT_FIELDS
+        else:
+            records = index.gen_ledger()
+            fields = export.LEDGER_FIELDS
+
+        chunk_size = app.config["CHUNK_SIZE"]
+        args = (records, fields, mimetype, resource)
+        return export.stream(*args, gzip=gzip, chunk_size=chunk_size)
+
+
 class Memoization(MethodView):
     def get(self):
         base_url = get_request_base()
@@ -734,6 +1612,7 @@ class Memoization(MethodView):
             message = f"Deleted cache for {url}"
         else:
             cache.clear()
+            index.clear()
             message = "Caches cleared!"
 
         response = {"message": message}
@@ -769,3 +1648,21 @@ add_rule(
     view_func=Order.as_view("order-end"),
     methods=["POST"],
 )
+add_rule(
+    f"{PREFIX}/export/<any(orders, ledger):resource>",
+    view_func=Export.as_view("export"),
+)
+add_rule(
+    f"{PREFIX}/export/<any(orders):resource>/<string:start>",
+    view_func=Export.as_view("export-start"),
+)
+add_rule(
+    f"{PREFIX}/export/<any(orders):resource>/<string:start>/<string:end>",
+    view_func=Export.as_view("export-end"),
+)
+add_rule(f"{PREFIX}/queues", view_func=Queues.as_view("queues"))
+add_rule(f"{PREFIX}/queues/<string:name>", view_func=Queues.as_view("queue"))
+add_rule(
+    f"{PREFIX}/queues/<string:name>/<string:registry>",
+    view_func=Queues.as_view("queue-registry"),
+)
@@ -3,9 +3,6 @@ from urllib.parse import urlencode
 
 import pygogo as gogo
 from flask import request, session, g
-from oauthlib.oauth2 import TokenExpiredError
-from requests_oauthlib import OAuth1Session, OAuth2Session
-from requests_oauthlib.oauth1_session import TokenRequestDenied
 
 from app import cache
 from config import Config
@@ -56,6 +53,10 @@ class MyAuth2Client(AuthClient):
         self._init_credentials()
 
     def _init_credentials(self):
+        # the oauth libraries are only imported once a client is actually used
+        from oauthlib.oauth2 import TokenExpiredError
+        from requests_oauthlib import OAuth2Session
+
         # TODO: check to make sure the token gets renewed on realtime_data call
         # See how it works
         try:
@@ -237,6 +238,8 @@ class MyAuth1Client(AuthClient):
         self._init_credentials()
 
     def _init_credentials(self):
+        from requests_oauthlib.oauth1_session import TokenRequestDenied
+
         if not (self.oauth_token and self.oauth_token_secret):
             try:
                 self.token = self.oauth_session.fetch_request_token(self.request_url)
@@ -264,6 +267,8 @@ class MyAuth1Client(AuthClient):
 
     @property
     def oauth_session(self):
+        from requests_oauthlib import OAuth1Session
+
         return OAuth1Session(self.client_id, **self.oauth_kwargs)
 
     @property
@@ -312,6 +317,8 @@ class MyAuth1Client(AuthClient):
         return (authorization_url, False)
 
     def fetch_token(self):
+        from requests_oauthlib.oauth1_session import TokenRequestDenied
+
         kwargs = {"verifier": request.args["oauth_verifier"]}
 
         try:
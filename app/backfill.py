@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+    app.backfill
+    ~~~~~~~~~~~~
+
+    Provides sharded backfills. A date range is split into windows and each
+    window is fetched and synced by its own rq job (on any worker dyno). After
+    each window, a coordinator job merges the progress and advances the
+    `next_start_date` watermark through the windows that (along with every
+    window before them) are done. A window whose orders were deferred (see
+    `app.budget`) is done once the jobs they were deferred to finish.
+"""
+from datetime import date, datetime
+from math import ceil
+from uuid import uuid4
+
+import pygogo as gogo
+
+from config import Config
+from app import jobs, scheduler
+from app.connection import get_connection, fails_safe
+from app.dashboard import decode
+from app.utils import gen_date_windows
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+DATE_FORMAT = Config.DATE_FORMAT
+REPORT_MONTHS = Config.REPORT_MONTHS
+SYNC_SLEEP = Config.SYNC_SLEEP
+BACKFILL_TTL = Config.BACKFILL_TTL
+BACKFILL_JOB_TIMEOUT = Config.BACKFILL_JOB_TIMEOUT
+
+# window ("<start>:<end>") -> status (queued, started, deferred, done, or
+# failed)
+WINDOWS_KEY = "backfill:{}:windows"
+
+# start, end, sleep, and created_at of a backfill
+META_KEY = "backfill:{}:meta"
+
+# ids of the unfinished jobs that a window's orders were deferred to
+PENDING_KEY = "backfill:{}:window:{}:pending"
+
+STATUSES = ["queued", "started", "deferred", "done", "failed"]
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def get_window_days(start_date, end_date, shards):
+    """
+    >>> get_window_days(date(2020, 1, 1), date(2020, 12, 31), 12)
+    31
+    >>> get_window_days(date(2020, 1, 1), date(2020, 1, 2), 12)
+    1
+    """
+    num_days = (end_date - start_date).days + 1
+    return max(ceil(num_days / shards), 1)
+
+
+def get_window_name(window):
+    return ":".join(d.strftime(DATE_FORMAT) for d in window)
+
+
+def get_done_date(statuses):
+    """ Gets the end of the last window that (along with every window before
+    it) is done
+
+    >>> first, second = "2020-01-01:2020-01-04", "2020-01-05:2020-01-08"
+    >>> get_done_date({second: "done", first: "done"})
+    '2020-01-08'
+    >>> get_done_date({first: "done", second: "deferred"})
+    '2020-01-04'
+    >>> get_done_date({first: "started", second: "done"})
+    """
+    done_date = None
+
+    for name in sorted(statuses):
+        if statuses[name] != "done":
+            break
+
+        done_date = name.split(":")[1]
+
+    return done_date
+
+
+def advance_watermark(start, done_date):
+    """ Moves the watermark up to `done_date` if the backfill started at (or
+    before) it, i.e., if every order up to `done_date` is now synced
+
+    Returns:
+        (bool): True if the watermark moved
+    """
+
+    def update(pipe):
+        watermark = decode(pipe.get(scheduler.WATERMARK_KEY))
+        contiguous = watermark is None or start <= watermark
+
+        if contiguous and (watermark is None or done_date > watermark):
+            pipe.multi()
+            pipe.set(scheduler.WATERMARK_KEY, done_date)
+            return True
+
+        return False
+
+    # WATCH keeps concurrent coordinators from moving the watermark back
+    kwargs = {"value_from_callable": True}
+    return get_connection().transaction(update, scheduler.WATERMARK_KEY, **kwargs)
+
+
+def get_progress(backfill_id):
+    conn = get_connection()
+    pipe = conn.pipeline(transaction=False)
+    pipe.hgetall(META_KEY.format(backfill_id))
+    pipe.hgetall(WINDOWS_KEY.format(backfill_id))
+    meta, windows = pipe.execute()
+
+    if not meta:
+        return None
+
+    meta = {decode(k): decode(v) for k, v in meta.items()}
+    statuses = {decode(k): decode(v) for k, v in windows.items()}
+    counts = {status: 0 for status in STATUSES}
+
+    for status in statuses.values():
+        counts[status] += 1
+
+    return {
+        **meta,
+        "backfill_id": backfill_id,
+        "counts": counts,
+        "done_date": get_done_date(statuses),
+        "windows": dict(sorted(statuses.items())),
+    }
+
+
+def coordinate(backfill_id):
+    """ Merges the windows' progress and advances the watermark
+    """
+    progress = get_progress(backfill_id)
+
+    if progress is None:
+        return {"ok": False, "message": f"Backfill '{backfill_id}' not found."}
+
+    done_date = progress["done_date"]
+    advanced = done_date and advance_watermark(progress["start"], done_date)
+    num_done = progress["counts"]["done"]
+    message = f"{num_done} of {len(progress['windows'])} windows are done."
+
+    if advanced:
+        message += f" Advanced the watermark to {done_date}."
+        logger.info(f"Backfill {backfill_id}: {message}")
+
+    return {"ok": True, "message": message}
+
+
+def get_deferred(result):
+    """ Gets the ids of the jobs a (compacted) sync result deferred orders to
+
+    >>> get_deferred({"ok": True, "ids": {"deferred": ["a"]}})
+    ['a']
+    >>> get_deferred(None)
+    []
+    """
+    result = result if isinstance(result, dict) else {}
+    return result.get("deferred") or result.get("ids", {}).get("deferred", [])
+
+
+def wait_for(backfill_id, name, job_ids):
+    """ Finishes a deferred window once each of `job_ids` finishes (see
+    `finish_deferred`)
+    """
+    pending_key = PENDING_KEY.format(backfill_id, name)
+
+    with get_connection().pipeline() as pipe:
+        pipe.sadd(pending_key, *job_ids)
+        pipe.expire(pending_key, BACKFILL_TTL)
+        pipe.execute()
+
+    # rq runs a dependent job once its dependency succeeds (and
+    # `release_waiting` runs it once the dependency fails)
+    for job_id in job_ids:
+        args = (finish_deferred, backfill_id, name, job_id)
+        jobs.enqueue(*args, depends_on=job_id, queue="high")
+
+
+@fails_safe()
+def release_waiting(job):
+    """ Enqueues the `finish_deferred` jobs waiting on a failed job (which rq
+    would otherwise leave waiting forever), so that they fail its window
+    """
+    jobs.get_queue("high").enqueue_dependents(job)
+
+
+def finish_deferred(backfill_id, name, job_id):
+    """ Marks a deferred window done once its last deferred job finishes (or
+    failed if one didn't sync its orders) and then merges the progress
+    """
+    from rq.job import Job
+    from rq.exceptions import NoSuchJobError
+
+    conn = get_connection()
+    windows_key = WINDOWS_KEY.format(backfill_id)
+    pending_key = PENDING_KEY.format(backfill_id, name)
+
+    try:
+        result = Job.fetch(job_id, connection=conn).result
+    except NoSuchJobError:
+        result = None
+
+    ok = isinstance(result, dict) and result.get("ok")
+    deferred = get_deferred(result)
+
+    if ok and deferred:
+        # the job deferred some of its orders in turn
+        wait_for(backfill_id, name, deferred)
+
+    def update(pipe):
+        pipe.srem(pending_key, job_id)
+        num_pending = pipe.scard(pending_key)
+        status = decode(pipe.hget(windows_key, name))
+
+        if status == "deferred" and not (ok and num_pending):
+            pipe.multi()
+            pipe.hset(windows_key, name, "done" if ok else "failed")
+
+    # WATCH keeps concurrent jobs from overwriting a failed window
+    conn.transaction(update, windows_key)
+    return coordinate(backfill_id)
+
+
+def sync_window(backfill_id, start, end, sleep=SYNC_SLEEP):
+    """ Syncs one window of a backfill and then enqueues the coordinator
+    """
+    from app.api import transfer_orders
+
+    conn = get_connection()
+    key = WINDOWS_KEY.format(backfill_id)
+    name = f"{start}:{end}"
+    conn.hset(key, name, "started")
+
+    try:
+        response = transfer_orders(start=start, end=end, sleep=sleep)
+        deferred = response.get("deferred")
+
+        if deferred:
+            conn.hset(key, name, "deferred")
+            wait_for(backfill_id, name, deferred)
+        else:
+            done = response["ok"] and not response.get("budget_exhausted")
+            conn.hset(key, name, "done" if done else "failed")
+    finally:
+        # a raised error leaves the window `started`, so the watermark stays
+        # put until the job is requeued
+        jobs.enqueue(coordinate, backfill_id, queue="high")
+
+    return response
+
+
+def start_backfill(start=None, end=None, shards=1, sleep=SYNC_SLEEP):
+    """ Enqueues a job for each of `shards` date windows
+
+    Args:
+        start (str): The first date (default: the `next_start_date` watermark or
+            `REPORT_MONTHS` before `end`).
+        end (str): The last date (default: today).
+        shards (int): Number of windows.
+    """
+    from app.api import get_start_date
+
+    end_date = parse_date(end) if end else date.today()
+    watermark = scheduler.get_next_start_date()
+
+    if start:
+        start_date = parse_date(start)
+    elif watermark:
+        start_date = parse_date(watermark)
+    else:
+        start_date = get_start_date(end_date, REPORT_MONTHS)
+
+    days = get_window_days(start_date, end_date, shards)
+    windows = list(gen_date_windows(start_date, end_date, days))
+    backfill_id = uuid4().hex
+    meta = {
+        "start": start_date.strftime(DATE_FORMAT),
+        "end": end_date.strftime(DATE_FORMAT),
+        "sleep": sleep,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+    with get_connection().pipeline() as pipe:
+        pipe.hset(META_KEY.format(backfill_id), mapping=meta)
+        pipe.hset(
+            WINDOWS_KEY.format(backfill_id),
+            mapping={get_window_name(window): "queued" for window in windows},
+        )
+        pipe.expire(META_KEY.format(backfill_id), BACKFILL_TTL)
+        pipe.expire(WINDOWS_KEY.format(backfill_id), BACKFILL_TTL)
+        pipe.execute()
+
+    for window_start, window_end in windows:
+        args = (window_start.strftime(DATE_FORMAT), window_end.strftime(DATE_FORMAT))
+        kwargs = {"sleep": sleep, "job_timeout": BACKFILL_JOB_TIMEOUT}
+        jobs.enqueue(sync_window, backfill_id, *args, **kwargs)
+
+    message = f"Enqueued {len(windows)} windows of {days} days "
+    message += f"from {meta['start']} to {meta['end']}."
+    logger.info(f"Backfill {backfill_id}: {message}")
+    return {"ok": True, "message": message, "backfill_id": backfill_id}
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+    app.bench
+    ~~~~~~~~~
+
+    Provides a benchmark harness that runs the sync against the local stand-in
+    upstreams (see `app.standin`)
+"""
+import json
+import time
+
+from os import path as p
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+import pygogo as gogo
+
+from flask import current_app
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from config import Config, PARENT_DIR
+from app import api, connection, jobs, transform
+from app.connection import get_connection, fails_safe
+from app.standin import create_standin, gen_orders, CLOZE_PREFIX, OPENCART_PREFIX
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+BENCH_REDIS_URL = Config.BENCH_REDIS_URL
+REDIS_URL = Config.RQ_DASHBOARD_REDIS_URL
+
+BASELINE_PATH = p.join(PARENT_DIR, "data", "bench-baseline.json")
+BATCH_SIZE = 1000
+SCENARIOS = {}
+
+# scenarios too fast to time over a few orders run on at least this many
+MIN_ORDERS = {"transform_single": 10 * BATCH_SIZE, "transform_batch": 10 * BATCH_SIZE}
+
+# slack so that sub-millisecond noise doesn't count as a regression
+MIN_LATENCY_SLACK_MS = 1
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+@contextmanager
+def serve(app):
+    """ Serves an app from a background thread on a random port
+    """
+    kwargs = {"threaded": True, "request_handler": QuietRequestHandler}
+    server = make_server("127.0.0.1", 0, app, **kwargs)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+
+
+@contextmanager
+def upstreams(url_root):
+    """ Points the api at the stand-in upstreams (and an empty order snapshot)
+    """
+    base_urls = (api.CLOZE_BASE_URL, api.PRICECLOSER_BASE_URL)
+    api.CLOZE_BASE_URL = f"{url_root}{CLOZE_PREFIX}"
+    api.PRICECLOSER_BASE_URL = f"{url_root}{OPENCART_PREFIX}"
+    cache_dir = current_app.config.get("CACHE_DIR")
+
+    try:
+        with TemporaryDirectory() as dirname:
+            current_app.config["CACHE_DIR"] = dirname
+            yield
+    finally:
+        api.CLOZE_BASE_URL, api.PRICECLOSER_BASE_URL = base_urls
+        current_app.config["CACHE_DIR"] = cache_dir
+
+
+def get_db(url):
+    """
+    >>> get_db("redis://localhost:6379/15")
+    ('localhost', 6379, 15)
+    >>> get_db("redis://localhost:6379") == get_db("redis://localhost/0")
+    True
+    """
+    from redis import ConnectionPool
+
+    kwargs = ConnectionPool.from_url(url).connection_kwargs
+    return kwargs.get("host"), kwargs.get("port", 6379), int(kwargs.get("db", 0))
+
+
+@contextmanager
+def isolated(url=BENCH_REDIS_URL):
+    """ Points the app (index, locks, metrics, and queues) at the benchmarks'
+    own redis db, which starts (and ends) empty
+    """
+    import redis
+
+    if get_db(url) == get_db(REDIS_URL):
+        raise RuntimeError("BENCH_REDIS_URL has to differ from the app's redis db.")
+
+    conn, queues = connection._conn, dict(jobs.queues)
+    connection._conn = bench_conn = redis.from_url(url)
+    jobs.queues.clear()
+
+    try:
+        yield bench_conn
+    finally:
+        connection._conn = conn
+        jobs.queues.clear()
+        jobs.queues.update(queues)
+
+
+@fails_safe()
+def flush():
+    get_connection().flushdb()
+
+
+@contextmanager
+def stopwatch(samples):
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+@contextmanager
+def timing(obj, attr, samples):
+    """ Records how long each call to `obj.attr` takes
+    """
+    func = getattr(obj, attr)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with stopwatch(samples):
+            return func(*args, **kwargs)
+
+    setattr(obj, attr, wrapper)
+
+    try:
+        yield
+    finally:
+        setattr(obj, attr, func)
+
+
+def get_range(orders):
+    dates = sorted(order["date_added"][:10] for order in orders)
+    return dates[0], dates[-1]
+
+
+@scenario
+def transfer_single(orders, samples):
+    for order in orders:
+        with stopwatch(samples):
+            api.transfer_orders(order["order_id"])
+
+
+@scenario
+def transfer_range(orders, samples):
+    start, end = get_range(orders)
+
+    # samples are per customer (each customer's orders sync together)
+    with timing(api, "add_customer_and_orders", samples):
+        api.transfer_orders(start=start, end=end, sleep=0)
+
+
+@scenario
+def transfer_enqueue(orders, samples):
+    queue = api.get_queue()
+    start, end = get_range(orders)
+
+    with timing(queue, "enqueue", samples):
+        api.transfer_orders(start=start, end=end, enqueue=True, sleep=0)
+
+
+@scenario
+def gen_manufacturers(orders, samples):
+    for order in orders:
+        with stopwatch(samples):
+            list(api.gen_manufacturers(order["products"]))
+
+
+@scenario
+def responsify(orders, samples):
+    for order in orders:
+        with stopwatch(samples):
+            api.jsonify(ok=True, message="", result=order)
+
+
+@scenario
+def transform_single(orders, samples):
+    for order in orders:
+        with stopwatch(samples):
+            api.create_customer_data(order, "people")
+            api.create_order_data(order, "")
+
+
+@scenario
+def transform_batch(orders, samples):
+    # samples are per batch (so only orders_per_sec compares with the above)
+    for pos in range(0, len(orders), BATCH_SIZE):
+        with stopwatch(samples):
+            payloads = transform.gen_payloads(orders[pos : pos + BATCH_SIZE])
+            deque(payloads, maxlen=0)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    pos = round(pct / 100 * (len(ordered) - 1))
+    return ordered[pos] if ordered else 0
+
+
+def redis_available():
+    from redis.exceptions import RedisError
+
+    try:
+        return get_connection().ping()
+    except RedisError:
+        return False
+
+
+def run_scenario(name, num_orders=100, **kwargs):
+    num_orders = max(num_orders, MIN_ORDERS.get(name, 0))
+    orders = list(gen_orders(num_orders))
+    standin = create_standin(orders, **kwargs)
+    samples = []
+
+    # start from an empty Cloze and index so every run does the same work
+    flush()
+
+    with serve(standin) as url_root, upstreams(url_root):
+        start = time.perf_counter()
+        SCENARIOS[name](orders, samples)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "orders_per_sec": round(num_orders / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "calls_per_order": round(sum(standin.calls.values()) / num_orders, 3),
+    }
+
+
+def run_benchmarks(names=None, **kwargs):
+    """ Runs the benchmarks on their own redis db (see `isolated`)
+    """
+    results = {}
+
+    with isolated():
+        for name in names or SCENARIOS:
+            if name == "transfer_enqueue" and not redis_available():
+                logger.warning(f"Skipping {name} since redis isn't available.")
+            else:
+                results[name] = run_scenario(name, **kwargs)
+
+        flush()
+
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """ Saves the results as the baseline of their scenarios (keeping the
+    baseline of the others)
+    """
+    baseline = {**load_baseline(path), **results}
+
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def gen_regressions(results, baseline, tolerance=0.25):
+    """ Compares benchmark results with a baseline
+
+    Yields:
+        (str): A description of each regression
+    """
+    for name, result in results.items():
+        base = baseline.get(name)
+
+        if not base:
+            continue
+
+        min_rate = base["orders_per_sec"] * (1 - tolerance)
+        max_p99 = base["p99_ms"] * (1 + tolerance) + MIN_LATENCY_SLACK_MS
+
+        if result["orders_per_sec"] < min_rate:
+            yield f"{name}: {result['orders_per_sec']} orders/sec < {min_rate:.2f}"
+
+        if result["p99_ms"] > max_p99:
+            yield f"{name}: p99 {result['p99_ms']} ms > {max_p99:.3f} ms"
+
+        if result["calls_per_order"] > base["calls_per_order"]:
+            calls = (result["calls_per_order"], base["calls_per_order"])
+            yield f"{name}: {calls[0]} upstream calls/order > {calls[1]}"
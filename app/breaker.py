@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+    app.breaker
+    ~~~~~~~~~~~
+
+    Provides a circuit breaker for each upstream (Cloze and PriceCloser) whose
+    state is shared by every web and worker process through redis.
+
+    After `BREAKER_FAILURES` failed calls (connection errors, timeouts, or 5xx
+    responses) within `BREAKER_WINDOW` seconds, the breaker opens. Calls then
+    fail immediately and the workers park sync jobs in the `deferred` queue
+    instead of running them. After `BREAKER_COOLDOWN` seconds the breaker is
+    half-open: a single probe call goes through. If it succeeds, the breaker
+    closes and a job (and then each scheduler tick) requeues the deferred jobs
+    `RESUME_MAX_JOBS` at a time. If it fails, the breaker opens again.
+"""
+import pygogo as gogo
+import requests
+
+from config import Config
+from app import budget
+from app.connection import get_connection, fails_safe
+from app.dashboard import decode
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+BREAKER_FAILURES = Config.BREAKER_FAILURES
+BREAKER_WINDOW = Config.BREAKER_WINDOW
+BREAKER_COOLDOWN = Config.BREAKER_COOLDOWN
+BREAKER_PROBE_TTL = Config.BREAKER_PROBE_TTL
+
+UPSTREAMS = ["cloze", "pricecloser"]
+DEFERRED_QUEUE = "deferred"
+RESUME_BATCH_SIZE = 100
+
+# the most deferred jobs a `resume` call requeues (the next call requeues more)
+RESUME_MAX_JOBS = 1000
+
+# the failures within the current window
+FAILURES_KEY = "breaker:{}:failures"
+
+# exists while the breaker is open
+OPEN_KEY = "breaker:{}:open"
+
+# exists from when the breaker opens until a probe succeeds
+TRIPPED_KEY = "breaker:{}:tripped"
+
+# exists while a half-open probe is in flight
+PROBE_KEY = "breaker:{}:probe"
+
+# ids of the jobs that failed because a breaker opened while they ran
+FAILED_JOBS_KEY = "breaker:failed-jobs"
+
+# the jobs that call the upstreams (and so get parked while a breaker is open)
+UPSTREAM_JOBS = {
+    "app.api.add_customer_and_order",
+    "app.api.add_customer_and_orders",
+    "app.api.sync_order",
+    "app.api.sync_orders",
+    "app.api.update_order_stage",
+    "app.api.reconcile_orders",
+    "app.api.transfer_orders",
+    "app.backfill.sync_window",
+}
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    def __init__(self, upstream):
+        self.upstream = upstream
+        super().__init__(f"The {upstream} circuit breaker is open.")
+
+
+def get_keys(upstream):
+    keys = (FAILURES_KEY, OPEN_KEY, TRIPPED_KEY, PROBE_KEY)
+    return [key.format(upstream) for key in keys]
+
+
+@fails_safe("closed")
+def get_state(upstream):
+    """
+    Returns:
+        (str): Either `closed`, `open`, or `half-open`
+    """
+    _, open_key, tripped_key, _ = get_keys(upstream)
+    is_open, tripped = get_connection().mget(open_key, tripped_key)
+
+    if is_open:
+        state = "open"
+    elif tripped:
+        state = "half-open"
+    else:
+        state = "closed"
+
+    return state
+
+
+def get_states():
+    return {upstream: get_state(upstream) for upstream in UPSTREAMS}
+
+
+@fails_safe(True)
+def take_probe(upstream):
+    """ Checks if this call gets to be the half-open probe
+    """
+    probe_key = PROBE_KEY.format(upstream)
+    return bool(get_connection().set(probe_key, 1, nx=True, ex=BREAKER_PROBE_TTL))
+
+
+@fails_safe()
+def close(upstream):
+    from app.jobs import enqueue
+
+    get_connection().delete(*get_keys(upstream))
+    logger.info(f"Closed the {upstream} circuit breaker.")
+
+    # the probe that closes the breaker may be serving a request
+    enqueue(resume, queue="high")
+
+
+@fails_safe()
+def record_failure(upstream):
+    failures_key, open_key, tripped_key, probe_key = get_keys(upstream)
+    conn = get_connection()
+
+    with conn.pipeline() as pipe:
+        pipe.incr(failures_key)
+        pipe.expire(failures_key, BREAKER_WINDOW)
+        pipe.exists(tripped_key)
+        num_failures, _, tripped = pipe.execute()
+
+    # a failed probe reopens the breaker right away
+    if tripped or num_failures >= BREAKER_FAILURES:
+        with conn.pipeline() as pipe:
+            pipe.set(open_key, 1, ex=BREAKER_COOLDOWN)
+            pipe.set(tripped_key, 1)
+            pipe.delete(failures_key, probe_key)
+            pipe.execute()
+
+        logger.warning(f"Opened the {upstream} circuit breaker.")
+
+
+class Session(requests.Session):
+    """ A `requests` session whose calls go through the upstream's breaker (and
+    time out per `app.budget`)
+    """
+
+    def __init__(self, upstream):
+        super().__init__()
+        self.upstream = upstream
+
+    def request(self, *args, **kwargs):
+        state = get_state(self.upstream)
+
+        # while half-open, only the probe goes through
+        if state == "open" or (state == "half-open" and not take_probe(self.upstream)):
+            raise CircuitOpenError(self.upstream)
+
+        kwargs.setdefault("timeout", budget.get_timeout(self.upstream))
+
+        try:
+            r = super().request(*args, **kwargs)
+        except requests.Timeout as e:
+            # a call cut short by the budget says nothing about the upstream
+            if not budget.has():
+                raise budget.BudgetExhausted(self.upstream) from e
+
+            record_failure(self.upstream)
+            raise
+        except requests.ConnectionError:
+            record_failure(self.upstream)
+            raise
+
+        if r.status_code >= 500:
+            record_failure(self.upstream)
+        elif state == "half-open":
+            close(self.upstream)
+
+        return r
+
+
+def should_park(job):
+    if job.func_name in UPSTREAM_JOBS:
+        parked = "open" in get_states().values()
+    else:
+        parked = False
+
+    return parked
+
+
+def park(job):
+    """ Moves a job to the deferred queue (along with the queue to resume it on)
+    """
+    from app.jobs import get_queue
+
+    job.meta["deferred_from"] = job.origin
+    get_queue(DEFERRED_QUEUE).enqueue_job(job)
+    logger.info(f"Parked job {job.id} in the {DEFERRED_QUEUE} queue.")
+
+
+@fails_safe(0)
+def defer_failed(job):
+    """ Marks a job (that failed since a breaker opened while it ran) to be
+    requeued once the breakers close
+    """
+    return get_connection().sadd(FAILED_JOBS_KEY, job.id)
+
+
+def requeue_failed(conn):
+    from rq.job import Job
+    from rq.registry import FailedJobRegistry
+    from rq.exceptions import NoSuchJobError, InvalidJobOperation
+
+    num_requeued = 0
+
+    for job_id in map(decode, conn.smembers(FAILED_JOBS_KEY)):
+        try:
+            job = Job.fetch(job_id, connection=conn)
+            FailedJobRegistry(job.origin, connection=conn).requeue(job)
+        except (NoSuchJobError, InvalidJobOperation):
+            # the job expired, was archived, or was already requeued
+            pass
+        else:
+            num_requeued += 1
+
+        conn.srem(FAILED_JOBS_KEY, job_id)
+
+    return num_requeued
+
+
+@fails_safe(0)
+def resume(batch_size=RESUME_BATCH_SIZE, max_jobs=RESUME_MAX_JOBS):
+    """ Requeues the deferred (and breaker failed) jobs once every breaker is
+    closed. While a breaker is half-open, only one deferred job is requeued (to
+    probe the upstream).
+
+    Args:
+        max_jobs (int): The most deferred jobs to requeue (the rest wait for
+            the next call).
+
+    Returns:
+        (int): The number of requeued jobs
+    """
+    from app.jobs import get_queue
+
+    states = get_states()
+    half_open = [u for u, state in states.items() if state == "half-open"]
+    probing = any(get_connection().exists(PROBE_KEY.format(u)) for u in half_open)
+    deferred = get_queue(DEFERRED_QUEUE)
+
+    if "open" in states.values() or probing:
+        return 0
+
+    num_resumed = 0 if half_open else requeue_failed(get_connection())
+    num_left = 1 if half_open else max_jobs
+
+    while num_left > 0:
+        # while half-open, the requeued job is the probe
+        num_jobs = min(batch_size, num_left)
+        deferred_jobs = [job for job in deferred.get_jobs(0, num_jobs) if job]
+
+        for job in deferred_jobs:
+            # a concurrent `resume` may have requeued the job already
+            if deferred.remove(job):
+                queue = get_queue(job.meta.pop("deferred_from", "default"))
+                queue.enqueue_job(job)
+                num_resumed += 1
+                num_left -= 1
+
+        if len(deferred_jobs) < num_jobs:
+            break
+
+    if num_resumed:
+        logger.info(f"Resumed {num_resumed} deferred jobs.")
+
+    return num_resumed
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    app.budget
+    ~~~~~~~~~~
+
+    Provides upstream timeouts and a deadline budget for each request and job.
+
+    Every upstream call gets a connect and read timeout (clamped to the time
+    left in the budget), so a stalled socket can't hang a greenlet or job. Once
+    the budget runs out, the sync skips the remaining orders (or, in a job,
+    defers them to a new job) and says so in its response.
+"""
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import requests
+
+from flask import g, has_request_context
+
+from config import Config
+
+UPSTREAM_TIMEOUTS = Config.UPSTREAM_TIMEOUTS
+REQUEST_BUDGET = Config.REQUEST_BUDGET
+JOB_BUDGET_MARGIN = Config.JOB_BUDGET_MARGIN
+MIN_CALL_SECONDS = Config.MIN_CALL_SECONDS
+
+# the deadline (in `time.monotonic` seconds) of the current job (see
+# `get_current`)
+current_deadline = ContextVar("current_deadline", default=None)
+
+
+class BudgetExhausted(requests.exceptions.RequestException):
+    def __init__(self, upstream=None):
+        self.upstream = upstream
+        message = "The time budget ran out"
+        message += f" before calling {upstream}." if upstream else "."
+        super().__init__(message)
+
+
+def get_current(var, name):
+    """ Gets the value of a job's context variable or else of the current
+    request's `g.<name>`. Requests can't use context variables since the gevent
+    greenlets serving them share them.
+    """
+    value = var.get()
+
+    if value is None and has_request_context():
+        value = g.get(name)
+
+    return value
+
+
+def get_deadline():
+    return get_current(current_deadline, "deadline")
+
+
+def start_request(seconds=REQUEST_BUDGET):
+    g.deadline = time.monotonic() + seconds if seconds else None
+
+
+def lift():
+    """ Removes the current request's budget (e.g., for streamed responses)
+    """
+    g.deadline = None
+
+
+@contextmanager
+def budgeting(seconds):
+    """ Sets the budget of a job (or of part of one)
+
+    Args:
+        seconds (int): The budget (None or 0 for no budget). A nested budget
+            never extends the outer one.
+    """
+    deadline = get_deadline()
+
+    if seconds:
+        deadline = min(filter(None, [deadline, time.monotonic() + seconds]))
+
+    token = current_deadline.set(deadline)
+
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
+
+
+def get_job_budget(job):
+    """ Gets a job's budget (leaving time to report before rq kills the job)
+
+    >>> from types import SimpleNamespace
+    >>> get_job_budget(SimpleNamespace(timeout=180))
+    170
+    >>> get_job_budget(SimpleNamespace(timeout=-1))
+    """
+    timeout = job.timeout or 0
+
+    if timeout > 0:
+        return max(timeout - JOB_BUDGET_MARGIN, MIN_CALL_SECONDS)
+
+
+def remaining():
+    """
+    Returns:
+        (float): The seconds left in the budget (or None if there's no budget)
+    """
+    deadline = get_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def has(seconds=0):
+    """ Checks if the budget has room for `seconds` plus an upstream call
+    """
+    left = remaining()
+    return left is None or left - seconds >= MIN_CALL_SECONDS
+
+
+def clamp(seconds):
+    """ Limits `seconds` (e.g., a lock wait) to the time left in the budget
+    """
+    left = remaining()
+    return seconds if left is None else max(min(seconds, left), 0)
+
+
+def get_timeout(upstream):
+    """ Gets the (connect, read) timeout of a call to `upstream`
+
+    Raises:
+        BudgetExhausted: If there's no time left for the call
+    """
+    connect, read = UPSTREAM_TIMEOUTS[upstream]
+    left = remaining()
+
+    if left is None:
+        timeout = (connect, read)
+    elif left < MIN_CALL_SECONDS:
+        raise BudgetExhausted(upstream)
+    else:
+        timeout = (min(connect, left), min(read, left))
+
+    return timeout
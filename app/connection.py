@@ -5,8 +5,61 @@
 
     Provides the redis connection
 """
-import redis
+from functools import wraps
+
+import pygogo as gogo
 
 from config import Config
 
-conn = redis.from_url(Config.RQ_DASHBOARD_REDIS_URL)
+logger = gogo.Gogo(__name__, monolog=True).logger
+_conn = None
+
+
+def get_connection():
+    """ Lazily creates the redis connection so that importing the app (e.g., on
+    dyno boot or in a forked rq job) doesn't pay for it
+    """
+    global _conn
+
+    if _conn is None:
+        import redis
+
+        _conn = redis.from_url(Config.RQ_DASHBOARD_REDIS_URL)
+
+    return _conn
+
+
+def reset_connection():
+    """ Drops the redis connection, e.g., after forking
+    """
+    global _conn
+    _conn = None
+
+
+def fails_safe(default=None):
+    """ For redis backed optimizations (indexes, metrics, etc.) where an
+    unavailable redis shouldn't break the request or job
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            from redis.exceptions import RedisError
+
+            try:
+                return func(*args, **kwargs)
+            except RedisError as e:
+                logger.warning(f"{func.__module__}.{func.__name__} failed: {e}")
+                return default
+
+        return wrapper
+
+    return decorator
+
+
+def __getattr__(name):
+    # keeps `from app.connection import conn` working
+    if name == "conn":
+        return get_connection()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
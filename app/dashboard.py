@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+    app.dashboard
+    ~~~~~~~~~~~~~
+
+    Provides cheap, aggregated rq queue stats. Unlike rq-dashboard (which
+    fetches every job hash), counts come from `LLEN`/`ZCARD` and job listings
+    only read one page of job hashes (and only the fields they need).
+"""
+from app.connection import get_connection
+
+QUEUES_KEY = "rq:queues"
+QUEUE_KEY = "rq:queue:{}"
+JOB_KEY = "rq:job:{}"
+
+# registry -> key template (`queued` is the queue itself)
+REGISTRIES = {
+    "queued": QUEUE_KEY,
+    "started": "rq:wip:{}",
+    "finished": "rq:finished:{}",
+    "failed": "rq:failed:{}",
+    "deferred": "rq:deferred:{}",
+    "scheduled": "rq:scheduled:{}",
+}
+
+JOB_FIELDS = [
+    "status",
+    "origin",
+    "description",
+    "created_at",
+    "enqueued_at",
+    "started_at",
+    "ended_at",
+]
+
+# descriptions include the job's arguments, e.g., an entire order
+DESCRIPTION_LENGTH = 120
+ENCODING = "utf-8"
+
+
+def decode(value):
+    return value.decode(ENCODING) if isinstance(value, bytes) else value
+
+
+def get_queue_names(conn=None):
+    conn = conn or get_connection()
+    prefix = QUEUE_KEY.format("")
+    return sorted(decode(key)[len(prefix) :] for key in conn.smembers(QUEUES_KEY))
+
+
+def get_summary():
+    """ Counts the jobs in each queue and registry (in two round trips)
+
+    Returns:
+        (dict): queue name -> registry -> number of jobs
+    """
+    conn = get_connection()
+    names = get_queue_names(conn)
+    pipe = conn.pipeline(transaction=False)
+
+    for name in names:
+        pipe.llen(QUEUE_KEY.format(name))
+
+        for registry, template in REGISTRIES.items():
+            if registry != "queued":
+                pipe.zcard(template.format(name))
+
+    counts = iter(pipe.execute())
+    return {name: {registry: next(counts) for registry in REGISTRIES} for name in names}
+
+
+def get_job(job_id, values):
+    job = dict(zip(JOB_FIELDS, map(decode, values)))
+    description = job.get("description") or ""
+
+    if len(description) > DESCRIPTION_LENGTH:
+        job["description"] = f"{description[:DESCRIPTION_LENGTH]}..."
+
+    return {"id": job_id, **job}
+
+
+def get_jobs(name, registry="queued", page=1, per_page=50):
+    """ Lists one page of a queue's (or registry's) jobs (in two round trips)
+
+    Args:
+        name (str): The queue name.
+        registry (str): One of `REGISTRIES` (default: queued).
+        page (int): The page number (starting at 1).
+        per_page (int): The number of jobs per page.
+
+    Returns:
+        (dict): The total number of jobs and the page of jobs (most recent
+            first for registries, next up first for the queue)
+    """
+    conn = get_connection()
+    key = REGISTRIES[registry].format(name)
+    start = (page - 1) * per_page
+    end = start + per_page - 1
+    pipe = conn.pipeline(transaction=False)
+
+    if registry == "queued":
+        pipe.llen(key)
+        pipe.lrange(key, start, end)
+    else:
+        pipe.zcard(key)
+        pipe.zrevrange(key, start, end)
+
+    total, job_ids = pipe.execute()
+    job_ids = list(map(decode, job_ids))
+
+    for job_id in job_ids:
+        pipe.hmget(JOB_KEY.format(job_id), JOB_FIELDS)
+
+    jobs = [
+        get_job(job_id, values)
+        for job_id, values in zip(job_ids, pipe.execute())
+        if any(values)
+    ]
+
+    return {
+        "queue": name,
+        "registry": registry,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "jobs": jobs,
+    }
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+    app.export
+    ~~~~~~~~~~
+
+    Provides constant memory CSV and NDJSON exports (optionally gzipped as they
+    stream)
+"""
+import csv
+import zlib
+
+from io import StringIO
+from json import dumps
+
+from flask import Response, stream_with_context
+
+from app.jobs import ORDER_FIELDS
+
+ENCODING = "utf-8"
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+EXPORT_MIMETYPES = [CSV, NDJSON]
+EXTENSIONS = {CSV: "csv", NDJSON: "ndjson"}
+
+ORDER_EXPORT_FIELDS = ORDER_FIELDS + ["product_ids"]
+LEDGER_FIELDS = ["order_id", "project_id", "person_id"]
+
+
+def get_order_row(pricecloser_order):
+    """
+    >>> products = [{"product_id": "2"}, {"product_id": "3"}]
+    >>> order = {"order_id": "1", "products": products}
+    >>> get_order_row(order)["product_ids"]
+    '2;3'
+    """
+    row = {field: pricecloser_order.get(field, "") for field in ORDER_FIELDS}
+    products = pricecloser_order.get("products") or []
+    row["product_ids"] = ";".join(str(p["product_id"]) for p in products)
+    return row
+
+
+def gen_csv(records, fields, chunk_size=256):
+    """ Generates CSV text `chunk_size` rows at a time
+
+    >>> list(gen_csv([{"a": 1, "b": 2}, {"a": 3}], ["a", "b"]))
+    ['a,b\\r\\n1,2\\r\\n3,\\r\\n']
+    """
+    f = StringIO()
+    writer = csv.DictWriter(f, fields, extrasaction="ignore")
+    writer.writeheader()
+
+    for num, record in enumerate(records, 1):
+        writer.writerow(record)
+
+        if not num % chunk_size:
+            yield f.getvalue()
+            f.seek(0)
+            f.truncate()
+
+    if f.tell():
+        yield f.getvalue()
+
+
+def gen_ndjson(records, fields, chunk_size=256):
+    """ Generates newline delimited JSON `chunk_size` rows at a time
+
+    >>> list(gen_ndjson([{"a": 1, "b": 2}], ["a"]))
+    ['{"a": 1}\\n']
+    """
+    lines = []
+
+    for record in records:
+        lines.append(dumps({field: record.get(field) for field in fields}))
+
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def gen_gzip(chunks, level=6):
+    """ Gzips text chunks as they come in
+
+    >>> import gzip
+    >>> gzip.decompress(b"".join(gen_gzip(["a,b\\r\\n", "1,2\\r\\n"])))
+    b'a,b\\r\\n1,2\\r\\n'
+    """
+    # wbits 16 + MAX_WBITS writes a gzip (instead of zlib) header
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode(ENCODING))
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def stream(records, fields, mimetype, filename, gzip=False, chunk_size=256):
+    """ Creates a streaming response. Only `chunk_size` records are ever held in
+    memory.
+    """
+    gen = gen_ndjson if mimetype == NDJSON else gen_csv
+    chunks = gen(records, fields, chunk_size)
+    extension = EXTENSIONS[mimetype]
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}.{extension}",
+        "Vary": "Accept, Accept-Encoding",
+    }
+
+    if gzip:
+        # setting the encoding also keeps Flask-Compress from buffering it all
+        chunks = gen_gzip(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    content_type = f"{mimetype}; charset={ENCODING}"
+    body = stream_with_context(chunks)
+    return Response(body, content_type=content_type, headers=headers)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+    app.index
+    ~~~~~~~~~
+
+    Provides a redis index of the orders and customers that were synced to Cloze
+    so that existence and link checks don't require Cloze API calls
+"""
+from app.connection import get_connection, fails_safe
+
+# order_id -> Cloze project id
+PROJECTS_KEY = "index:projects"
+
+# Every person is keyed by their email (see `get_person_key`) since a person
+# the sync creates has no Cloze (direct) id until Cloze is read again.
+
+# person key -> Cloze person id
+PEOPLE_KEY = "index:people"
+
+# order_id -> key of the person linked to the order's project
+ORDER_CUSTOMERS_KEY = "index:order-customers"
+
+# person key -> ids of the orders linked to the person
+PERSON_ORDERS_KEY = "index:person:{}:orders"
+
+ENCODING = "utf-8"
+
+
+def decode(value):
+    return value.decode(ENCODING) if isinstance(value, bytes) else value
+
+
+def get_person_key(email):
+    """
+    >>> get_person_key(" Me@Example.com")
+    'me@example.com'
+    """
+    return email.strip().lower()
+
+
+@fails_safe()
+def get_project_id(order_id):
+    return decode(get_connection().hget(PROJECTS_KEY, order_id))
+
+
+@fails_safe()
+def get_person_id(email):
+    return decode(get_connection().hget(PEOPLE_KEY, get_person_key(email)))
+
+
+@fails_safe(False)
+def is_linked(order_id, email):
+    """ Checks if an order's project is linked to a person (as of the last sync)
+    """
+    person_key = decode(get_connection().hget(ORDER_CUSTOMERS_KEY, order_id))
+    return person_key == get_person_key(email)
+
+
+@fails_safe(False)
+def has_order(email, order_id):
+    key = PERSON_ORDERS_KEY.format(get_person_key(email))
+    return bool(get_connection().sismember(key, order_id))
+
+
+@fails_safe(0)
+def add_orders(email, *order_ids):
+    key = PERSON_ORDERS_KEY.format(get_person_key(email))
+    return get_connection().sadd(key, *order_ids) if order_ids else 0
+
+
+@fails_safe(False)
+def is_synced(order_id, email):
+    """ Checks if an order, its customer, and the links between them are all in
+    Cloze (as of the last successful sync)
+    """
+    person_key = get_person_key(email)
+    pipe = get_connection().pipeline(transaction=False)
+    pipe.hget(PROJECTS_KEY, order_id)
+    pipe.hget(ORDER_CUSTOMERS_KEY, order_id)
+    pipe.sismember(PERSON_ORDERS_KEY.format(person_key), order_id)
+    project_id, linked_key, has_linked = pipe.execute()
+
+    return bool(project_id and decode(linked_key) == person_key and has_linked)
+
+
+@fails_safe(False)
+def record_sync(order_id, email, project_id, person_id):
+    """ Atomically records a successfully synced order
+    """
+    person_key = get_person_key(email)
+
+    with get_connection().pipeline() as pipe:
+        pipe.hset(PROJECTS_KEY, order_id, project_id)
+        pipe.hset(PEOPLE_KEY, person_key, person_id)
+        pipe.hset(ORDER_CUSTOMERS_KEY, order_id, person_key)
+        pipe.sadd(PERSON_ORDERS_KEY.format(person_key), order_id)
+        pipe.execute()
+
+    return True
+
+
+def gen_ledger(count=500):
+    """ Generates the synced orders along with their Cloze project and person
+    ids (`count` orders at a time)
+    """
+    conn = get_connection()
+    cursor = None
+
+    while cursor != 0:
+        cursor, projects = conn.hscan(PROJECTS_KEY, cursor or 0, count=count)
+        order_ids = list(projects)
+
+        if order_ids:
+            person_keys = conn.hmget(ORDER_CUSTOMERS_KEY, order_ids)
+            person_ids = conn.hmget(PEOPLE_KEY, [key or "" for key in person_keys])
+        else:
+            person_ids = []
+
+        for order_id, person_id in zip(order_ids, person_ids):
+            yield {
+                "order_id": decode(order_id),
+                "project_id": decode(projects[order_id]),
+                "person_id": decode(person_id),
+            }
+
+
+@fails_safe(0)
+def forget(*order_ids):
+    """ Removes orders (and their links) from the index, e.g., when they turn
+    out to be missing from Cloze
+    """
+    if not order_ids:
+        return 0
+
+    conn = get_connection()
+    person_keys = conn.hmget(ORDER_CUSTOMERS_KEY, order_ids)
+
+    with conn.pipeline() as pipe:
+        pipe.hdel(PROJECTS_KEY, *order_ids)
+        pipe.hdel(ORDER_CUSTOMERS_KEY, *order_ids)
+
+        # otherwise `has_order` would skip re-linking the re-created project
+        for order_id, person_key in zip(order_ids, person_keys):
+            if person_key:
+                pipe.srem(PERSON_ORDERS_KEY.format(decode(person_key)), order_id)
+
+        num_projects, num_links, *_ = pipe.execute()
+
+    return num_projects + num_links
+
+
+@fails_safe(0)
+def clear():
+    conn = get_connection()
+    keys = [PROJECTS_KEY, PEOPLE_KEY, ORDER_CUSTOMERS_KEY]
+    keys.extend(conn.scan_iter(PERSON_ORDERS_KEY.format("*")))
+    return conn.delete(*keys)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+    app.instrument
+    ~~~~~~~~~~~~~~
+
+    Provides per-request and per-job instrumentation of upstream (Cloze and
+    PriceCloser) calls
+"""
+import re
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isgeneratorfunction
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import pygogo as gogo
+
+from flask import g
+
+from app.budget import get_current
+
+logger = gogo.Gogo(
+    __name__, low_formatter=gogo.formatters.structured_formatter, monolog=True
+).logger
+
+# the stats of the current job (see `budget.get_current`)
+current_stats = ContextVar("current_stats", default=None)
+
+# collapses ids and dates so that each endpoint is reported once
+PARAM_REGEX = re.compile(r"/[0-9][^/]*")
+
+
+def new_stats():
+    return {"upstreams": {}, "timers": {}, "counters": {}}
+
+
+def get_stats():
+    return get_current(current_stats, "upstream_stats")
+
+
+def start_request():
+    g.upstream_stats = new_stats()
+
+
+@contextmanager
+def recording():
+    token = current_stats.set(new_stats())
+
+    try:
+        yield current_stats.get()
+    finally:
+        current_stats.reset(token)
+
+
+def get_endpoint(upstream, url, method="GET"):
+    """
+    >>> get_endpoint("pricecloser", "http://pc.com/api/rest_admin/orders/12")
+    'pricecloser GET /api/rest_admin/orders/:id'
+    """
+    path = PARAM_REGEX.sub("/:id", urlsplit(url).path)
+    return f"{upstream} {method} {path}"
+
+
+def record_call(endpoint, duration, status_code=None, num_bytes=0):
+    stats = get_stats()
+
+    if stats is not None:
+        entry = stats["upstreams"].setdefault(
+            endpoint, {"calls": 0, "ms": 0, "bytes": 0, "status_codes": {}}
+        )
+        entry["calls"] += 1
+        entry["ms"] = round(entry["ms"] + duration * 1000, 3)
+        entry["bytes"] += num_bytes
+
+        if status_code:
+            status_codes = entry["status_codes"]
+            status_codes[status_code] = status_codes.get(status_code, 0) + 1
+
+
+def record_time(name, duration):
+    stats = get_stats()
+
+    if stats is not None:
+        entry = stats["timers"].setdefault(name, {"calls": 0, "ms": 0})
+        entry["calls"] += 1
+        entry["ms"] = round(entry["ms"] + duration * 1000, 3)
+
+
+def count(name, num=1):
+    stats = get_stats()
+
+    if stats is not None:
+        counters = stats["counters"]
+        counters[name] = counters.get(name, 0) + num
+
+
+@contextmanager
+def timer(name):
+    start_time = perf_counter()
+
+    try:
+        yield
+    finally:
+        record_time(name, perf_counter() - start_time)
+
+
+def timed(name):
+    """ Records how long a function takes (including (de)serialization). For
+    generators, the time spent iterating is recorded.
+    """
+
+    def decorator(func):
+        if isgeneratorfunction(func):
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with timer(name):
+                    yield from func(*args, **kwargs)
+
+        else:
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with timer(name):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_response_hook(upstream):
+    """ A `requests` response hook that records the endpoint, network time,
+    status code, and size of every upstream response
+    """
+
+    def hook(r, *args, **kwargs):
+        endpoint = get_endpoint(upstream, r.url, r.request.method)
+        num_bytes = len(r.content or b"")
+        record_call(endpoint, r.elapsed.total_seconds(), r.status_code, num_bytes)
+
+    return hook
+
+
+def summarize(stats):
+    """ Totals the upstream calls by upstream (e.g., `cloze`)
+    """
+    totals = {}
+
+    for endpoint, entry in stats["upstreams"].items():
+        upstream = endpoint.split(" ")[0]
+        total = totals.setdefault(upstream, {"calls": 0, "ms": 0, "bytes": 0})
+        total["calls"] += entry["calls"]
+        total["ms"] += entry["ms"]
+        total["bytes"] += entry["bytes"]
+
+    return totals
+
+
+def get_server_timing(stats):
+    """ Creates a `Server-Timing` header value
+
+    >>> stats = new_stats()
+    >>> stats["timers"]["sleep"] = {"calls": 1, "ms": 10}
+    >>> get_server_timing(stats)
+    'sleep;dur=10.0;desc="1 calls"'
+    """
+    entries = {**summarize(stats), **stats["timers"]}
+    metrics = (
+        f'{name};dur={entry["ms"]:.1f};desc="{entry["calls"]} calls"'
+        for name, entry in sorted(entries.items())
+    )
+    return ", ".join(metrics)
+
+
+def log_stats(stats, **kwargs):
+    if stats and (stats["upstreams"] or stats["timers"]):
+        extra = {**kwargs, **stats, "totals": summarize(stats)}
+        logger.info("upstream calls", extra=extra)
+
+
+def save_job_stats(job, stats):
+    """ Attaches the stats to an rq job's meta
+    """
+    if stats:
+        job.meta["upstream_stats"] = {**stats, "totals": summarize(stats)}
+        job.save_meta()
+        log_stats(stats, job_id=job.id, func=job.func_name)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+    app.jobs
+    ~~~~~~~~
+
+    Provides the rq queues and keeps the jobs' redis footprint bounded: per
+    function result/failure TTLs, trimmed job arguments, compact job results,
+    batched job lookups, and a janitor that archives failed jobs into a capped
+    redis stream
+"""
+import re
+import zlib
+
+from datetime import timedelta
+
+import pygogo as gogo
+
+from config import Config
+from app.connection import get_connection, fails_safe
+from app.dashboard import get_queue_names, decode, JOB_KEY, REGISTRIES
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+JOB_TTLS = Config.JOB_TTLS
+FAILED_JOB_GRACE = Config.FAILED_JOB_GRACE
+FAILED_JOBS_MAXLEN = Config.FAILED_JOBS_MAXLEN
+
+ARCHIVE_KEY = "archive:failed-jobs"
+ARCHIVE_FIELDS = ["description", "origin", "enqueued_at", "ended_at", "exc_info"]
+ARCHIVE_BATCH_SIZE = 500
+ORDER_ID_REGEX = re.compile(r"'order_id': '?(\w+)")
+
+# the only order fields the sync reads (OpenCart returns dozens more)
+ORDER_FIELDS = [
+    "order_id",
+    "customer_id",
+    "email",
+    "firstname",
+    "lastname",
+    "telephone",
+    "order_status",
+    "order_status_id",
+    "date_added",
+    "total",
+]
+
+RESULT_FIELDS = ["ok", "message", "status_code", "budget_exhausted"]
+
+# `skipped` and `deferred` (the orders left once the budget ran out and the
+# jobs they continue in) let clients follow a deferred sync
+ID_FIELDS = [
+    "order_id",
+    "job_id",
+    "direct",
+    "missing",
+    "missing_links",
+    "stage_mismatches",
+    "skipped",
+    "deferred",
+]
+
+# `get_results` field -> job hash field
+JOB_RESULT_FIELDS = {
+    "job_status": "status",
+    "result": "result",
+    "error": "exc_info",
+    "func": "description",
+    "origin": "origin",
+    "enqueued_at": "enqueued_at",
+    "started_at": "started_at",
+    "ended_at": "ended_at",
+}
+
+DEF_JOB_RESULT_FIELDS = ["job_status", "result"]
+
+queues = {}
+
+
+def get_queue(name="default"):
+    if name not in queues:
+        from rq import Queue
+
+        queues[name] = Queue(name, connection=get_connection())
+
+    return queues[name]
+
+
+def get_job_options(func):
+    """
+    >>> get_job_options(get_queue)["result_ttl"] == JOB_TTLS["default"]["result_ttl"]
+    True
+    """
+    return {**JOB_TTLS["default"], **JOB_TTLS.get(func.__name__, {})}
+
+
+def enqueue(func, *args, queue="default", **kwargs):
+    """ Enqueues a job with its function's result and failure TTLs (unless
+    given)
+    """
+    options = {**get_job_options(func), **kwargs}
+    return get_queue(queue).enqueue(func, *args, **options)
+
+
+def trim_order(pricecloser_order):
+    """ Drops the order fields that the sync doesn't use so that the pickled job
+    stays small
+
+    >>> products = [{"product_id": "2", "name": "x"}]
+    >>> order = {"order_id": "1", "comment": "...", "products": products}
+    >>> trim_order(order)
+    {'order_id': '1', 'products': [{'product_id': '2'}]}
+    """
+    trimmed = {k: pricecloser_order[k] for k in ORDER_FIELDS if k in pricecloser_order}
+
+    if "products" in pricecloser_order:
+        products = pricecloser_order["products"]
+        trimmed["products"] = [{"product_id": p["product_id"]} for p in products]
+
+    return trimmed
+
+
+def compact(response, order_id=None):
+    """ Reduces a response to its status and ids
+
+    >>> compact({"ok": True, "message": "", "result": {"direct": "5", "name": "Me"}})
+    {'ok': True, 'message': '', 'ids': {'direct': '5'}}
+    >>> compact({"ok": True, "skipped": ["1"], "deferred": ["j"], "result": []})
+    {'ok': True, 'ids': {'skipped': ['1'], 'deferred': ['j']}}
+    """
+    if not isinstance(response, dict):
+        return response
+
+    compacted = {k: response[k] for k in RESULT_FIELDS if k in response}
+    result = response.get("result")
+    ids = {k: response[k] for k in ID_FIELDS if k in response}
+
+    if isinstance(result, dict):
+        ids.update((k, result[k]) for k in ID_FIELDS if k in result)
+
+    if order_id:
+        ids["order_id"] = str(order_id)
+
+    if ids:
+        compacted["ids"] = ids
+
+    return compacted
+
+
+def get_error(exc_info):
+    """ Gets the last line of a job's traceback (which rq only sometimes
+    compresses)
+    """
+    if exc_info:
+        try:
+            exc_info = zlib.decompress(exc_info)
+        except zlib.error:
+            pass
+
+        lines = exc_info.decode("utf-8").strip().splitlines()
+        error = lines[-1] if lines else ""
+    else:
+        error = ""
+
+    return error
+
+
+def summarize_job(job_id, values):
+    job = dict(zip(ARCHIVE_FIELDS, values))
+    description = decode(job["description"]) or ""
+    order_id = ORDER_ID_REGEX.search(description)
+    error = get_error(job["exc_info"])
+
+    return {
+        "job_id": job_id,
+        "func": description.split("(")[0],
+        "order_id": order_id.group(1) if order_id else "",
+        "origin": decode(job["origin"]) or "",
+        "enqueued_at": decode(job["enqueued_at"]) or "",
+        "failed_at": decode(job["ended_at"]) or "",
+        "error": error,
+    }
+
+
+def get_job_result(values, fields, loads):
+    job = dict(zip(fields, values))
+
+    if "job_status" in job:
+        job["job_status"] = decode(job["job_status"]) or "job not found"
+
+    if job.get("result") is not None:
+        try:
+            job["result"] = loads(job["result"])
+        except Exception:
+            job["result"] = "Unserializable return value"
+
+    if "error" in job:
+        job["error"] = get_error(job["error"])
+
+    if "func" in job:
+        job["func"] = (decode(job["func"]) or "").split("(")[0]
+
+    for field in ["origin", "enqueued_at", "started_at", "ended_at"]:
+        if field in job:
+            job[field] = decode(job[field])
+
+    return job
+
+
+def get_results(job_ids, fields=None):
+    """ Looks up many jobs (in one round trip). Unlike `Job.fetch_many` (which
+    reads every job's whole hash, pickled arguments included), only the
+    requested fields are read.
+
+    Args:
+        job_ids (List[str]): The job ids.
+        fields (List[str]): The `JOB_RESULT_FIELDS` to include (default:
+            job_status and result).
+
+    Returns:
+        (dict): job id -> job fields (a missing job's status is `job not found`)
+    """
+    from rq.serializers import resolve_serializer
+
+    fields = fields or DEF_JOB_RESULT_FIELDS
+    hash_fields = [JOB_RESULT_FIELDS[field] for field in fields]
+    loads = resolve_serializer(None).loads
+    job_ids = list(dict.fromkeys(job_ids))
+    pipe = get_connection().pipeline(transaction=False)
+
+    for job_id in job_ids:
+        pipe.hmget(JOB_KEY.format(job_id), hash_fields)
+
+    return {
+        job_id: get_job_result(values, fields, loads)
+        for job_id, values in zip(job_ids, pipe.execute())
+    }
+
+
+@fails_safe(0)
+def archive_failed_jobs(grace=FAILED_JOB_GRACE, maxlen=FAILED_JOBS_MAXLEN):
+    """ Moves failed jobs older than `grace` seconds into a capped stream of
+    summaries (func, order id, and the last line of the traceback)
+
+    Returns:
+        (int): The number of archived jobs
+    """
+    from rq.utils import utcnow, utcparse
+
+    conn = get_connection()
+    cutoff = utcnow() - timedelta(seconds=grace)
+    num_archived = 0
+
+    for name in get_queue_names(conn):
+        registry_key = REGISTRIES["failed"].format(name)
+        job_ids = list(map(decode, conn.zrange(registry_key, 0, -1)))
+
+        for pos in range(0, len(job_ids), ARCHIVE_BATCH_SIZE):
+            batch = job_ids[pos : pos + ARCHIVE_BATCH_SIZE]
+            pipe = conn.pipeline(transaction=False)
+
+            for job_id in batch:
+                pipe.hmget(JOB_KEY.format(job_id), ARCHIVE_FIELDS)
+
+            for job_id, values in zip(batch, pipe.execute()):
+                job = dict(zip(ARCHIVE_FIELDS, values))
+                ended_at = decode(job["ended_at"])
+
+                if not any(values):
+                    # the job already expired
+                    pipe.zrem(registry_key, job_id)
+                elif ended_at and utcparse(ended_at) < cutoff:
+                    summary = summarize_job(job_id, values)
+                    pipe.xadd(ARCHIVE_KEY, summary, maxlen=maxlen, approximate=True)
+                    pipe.delete(JOB_KEY.format(job_id))
+                    pipe.zrem(registry_key, job_id)
+                    num_archived += 1
+
+            pipe.execute()
+
+    if num_archived:
+        logger.info(f"Archived {num_archived} failed jobs to {ARCHIVE_KEY}.")
+
+    return num_archived
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+    app.loadtest
+    ~~~~~~~~~~~~
+
+    Provides a load test of the web dyno. Each profile (a number of gunicorn
+    workers and greenlets per worker) runs gunicorn with `gunicorn.conf.py`
+    against the local stand-in upstreams (see `app.standin`) and reports the
+    order lookups (`GET /v1/order/<order_id>`) per second it sustains.
+"""
+import socket
+import sys
+import time
+
+from itertools import cycle
+from os import environ, path as p
+from subprocess import Popen, DEVNULL
+from threading import Thread
+
+import pygogo as gogo
+import requests
+
+from config import PARENT_DIR
+from app import api
+from app.bench import serve, percentile
+from app.standin import create_standin, gen_orders, CLOZE_PREFIX, OPENCART_PREFIX
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+CONF_PATH = p.join(PARENT_DIR, "gunicorn.conf.py")
+BOOT_TIMEOUT = 30
+
+# (workers, worker connections)
+PROFILES = [(1, 100), (3, 10), (3, 100), (3, 1000), (6, 100)]
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=BOOT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+        except requests.ConnectionError:
+            time.sleep(0.25)
+        else:
+            return True
+
+    return False
+
+
+def start_server(url_root, port, workers, connections, config_mode):
+    env = {
+        **environ,
+        "CLOZE_BASE_URL": f"{url_root}{CLOZE_PREFIX}",
+        "PRICECLOSER_BASE_URL": f"{url_root}{OPENCART_PREFIX}",
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_WORKER_CONNECTIONS": str(connections),
+    }
+
+    args = [sys.executable, "-m", "gunicorn", "-c", CONF_PATH]
+    args += ["-b", f"127.0.0.1:{port}", f"app:create_app('{config_mode}')"]
+    return Popen(args, cwd=PARENT_DIR, env=env, stdout=DEVNULL, stderr=DEVNULL)
+
+
+def drive(urls, samples, errors, stop_at):
+    """ Sends requests (one at a time) until `stop_at`
+    """
+    urls = cycle(urls)
+
+    with requests.Session() as session:
+        while time.monotonic() < stop_at:
+            url = next(urls)
+            start = time.perf_counter()
+
+            try:
+                r = session.get(url, timeout=30)
+            except requests.RequestException:
+                errors.append(url)
+            else:
+                if r.ok:
+                    samples.append(time.perf_counter() - start)
+                else:
+                    errors.append(url)
+
+
+def run_profile(
+    url_root, order_ids, workers, connections, concurrency=50, duration=10, **kwargs
+):
+    port = get_free_port()
+    config_mode = kwargs.get("config_mode", "Production")
+    server = start_server(url_root, port, workers, connections, config_mode)
+    base_url = f"http://127.0.0.1:{port}"
+    samples, errors = [], []
+
+    try:
+        if not wait_for(base_url):
+            raise RuntimeError(f"gunicorn didn't start on port {port}.")
+
+        urls = [f"{base_url}/v1/order/{order_id}" for order_id in order_ids]
+        start = time.monotonic()
+        args = (samples, errors, start + duration)
+
+        # each client starts at a different order
+        threads = [
+            Thread(target=drive, args=(urls[pos:] + urls[:pos], *args), daemon=True)
+            for pos in range(concurrency)
+        ]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.monotonic() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        "workers": workers,
+        "connections": connections,
+        "requests_per_sec": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "errors": len(errors),
+    }
+
+
+def add_customers(standin, orders):
+    """ Adds the customer of each order to the stand-in Cloze (so that looking
+    up an order's customer succeeds)
+    """
+    people = standin.standin["people"]
+
+    for order in orders:
+        people.set(order["email"], api.create_customer_data(order, "people"))
+
+
+def run_loadtest(profiles=None, num_orders=100, latency=0.1, **kwargs):
+    """ Runs each profile against the same stand-in upstreams
+
+    Returns:
+        (List[dict]): The results of each profile
+    """
+    orders = list(gen_orders(num_orders))
+    order_ids = [order["order_id"] for order in orders]
+    standin = create_standin(orders, latency=latency)
+    add_customers(standin, orders)
+
+    with serve(standin) as url_root:
+        return [
+            run_profile(url_root, order_ids, workers, connections, **kwargs)
+            for workers, connections in profiles or PROFILES
+        ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+    app.locks
+    ~~~~~~~~~
+
+    Provides per-customer redis locks. Syncing an order reads the Cloze person,
+    appends the order link, and writes the whole person back, so two workers
+    syncing orders of the same customer would overwrite each other's links.
+    Orders of different customers still sync in parallel.
+"""
+from contextlib import contextmanager
+
+from config import Config
+from app import instrument
+from app.connection import get_connection, fails_safe
+
+CUSTOMER_LOCK_TTL = Config.CUSTOMER_LOCK_TTL
+CUSTOMER_LOCK_WAIT = Config.CUSTOMER_LOCK_WAIT
+
+# email -> lock token
+CUSTOMER_LOCK_KEY = "lock:customer:{}"
+
+
+@fails_safe()
+def acquire(key, ttl, wait):
+    """
+    Returns:
+        (obj): The lock (or False if it's still held after `wait` seconds)
+    """
+    lock = get_connection().lock(key, timeout=ttl, blocking_timeout=wait)
+    return lock if lock.acquire() else False
+
+
+@fails_safe(False)
+def release(lock):
+    # raises a `LockError` (a `RedisError`) if the lock already expired
+    lock.release()
+    return True
+
+
+@contextmanager
+def customer_lock(email, ttl=CUSTOMER_LOCK_TTL, wait=CUSTOMER_LOCK_WAIT):
+    """ Serializes the syncs of a customer's orders across workers
+
+    Args:
+        email (str): The customer's email (Cloze's unique id for people).
+        ttl (int): Seconds after which the lock expires (in case the worker
+            holding it dies).
+        wait (int): Max seconds to wait for the lock.
+
+    Yields:
+        (bool): False if another worker held the lock for all of `wait`
+            seconds. An unavailable redis yields True (the sync just isn't
+            serialized).
+    """
+    key = CUSTOMER_LOCK_KEY.format(email.lower())
+
+    with instrument.timer("customer_lock"):
+        lock = acquire(key, ttl, wait)
+
+    try:
+        yield lock is not False
+    finally:
+        if lock is not None and lock is not False:
+            release(lock)
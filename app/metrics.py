@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+    app.metrics
+    ~~~~~~~~~~~
+
+    Provides redis backed counters and histograms (written by the web dynos and
+    the workers) and renders them in the Prometheus text exposition format
+"""
+import re
+import time
+
+from app.connection import get_connection, fails_safe
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# series (e.g., `rq_jobs_total{status="failed"}`) -> value
+COUNTERS_KEY = "metrics:counters"
+
+# epoch minute -> number of orders synced during the minute
+SYNCED_KEY = "metrics:orders-synced:{}"
+SYNCED_TTL = 3600
+
+# rq's own keys
+QUEUES_KEY = "rq:queues"
+WORKERS_KEY = "rq:workers"
+
+# jobs range from a single order (seconds) to a year of orders (hours)
+BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600, 10800)
+
+METRICS = {
+    "rq_queue_depth": ("gauge", "Jobs waiting in each queue"),
+    "rq_workers": ("gauge", "Registered rq workers"),
+    "rq_jobs_total": ("counter", "Jobs performed by status"),
+    "rq_job_wait_seconds": ("histogram", "Time jobs spent enqueued"),
+    "rq_job_run_seconds": ("histogram", "Time jobs spent running"),
+    "upstream_requests_total": ("counter", "Upstream calls by status class"),
+    "upstream_errors_total": ("counter", "Upstream calls that returned an error"),
+    "index_requests_total": ("counter", "Order index lookups by result"),
+    "orders_synced_total": ("counter", "Orders synced to Cloze"),
+    "orders_synced_per_minute": ("gauge", "Orders synced in the last full minute"),
+}
+
+HISTOGRAM_SUFFIXES = ("_bucket", "_sum", "_count")
+LE_REGEX = re.compile(r',?le="([^"]+)"')
+ENCODING = "utf-8"
+
+
+def get_series(name, **labels):
+    """
+    >>> get_series("rq_jobs_total", status="failed")
+    'rq_jobs_total{status="failed"}'
+    """
+    pairs = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{pairs}}}" if pairs else name
+
+
+def observe(pipe, name, value, **labels):
+    """ Adds a histogram observation to a pipeline
+    """
+    for bound in BUCKETS:
+        if value <= bound:
+            series = get_series(f"{name}_bucket", le=bound, **labels)
+            pipe.hincrby(COUNTERS_KEY, series, 1)
+
+    pipe.hincrby(COUNTERS_KEY, get_series(f"{name}_bucket", le="+Inf", **labels), 1)
+    pipe.hincrbyfloat(COUNTERS_KEY, get_series(f"{name}_sum", **labels), value)
+    pipe.hincrby(COUNTERS_KEY, get_series(f"{name}_count", **labels), 1)
+
+
+def get_minute(timestamp=None):
+    return int((timestamp or time.time()) // 60)
+
+
+def add_stats(pipe, stats):
+    """ Adds the upstream calls and counters of an `app.instrument` stats dict
+    to a pipeline
+    """
+    for endpoint, entry in stats["upstreams"].items():
+        upstream = endpoint.split(" ")[0]
+
+        for status_code, num in entry["status_codes"].items():
+            status = f"{str(status_code)[0]}xx"
+            series = get_series(
+                "upstream_requests_total", upstream=upstream, status=status
+            )
+            pipe.hincrby(COUNTERS_KEY, series, num)
+
+            if int(status_code) >= 400:
+                series = get_series("upstream_errors_total", upstream=upstream)
+                pipe.hincrby(COUNTERS_KEY, series, num)
+
+    counters = stats["counters"]
+
+    for result in ["hit", "miss"]:
+        num = counters.get(f"index_{result}")
+
+        if num:
+            series = get_series("index_requests_total", result=result)
+            pipe.hincrby(COUNTERS_KEY, series, num)
+
+    num_synced = counters.get("orders_synced")
+
+    if num_synced:
+        key = SYNCED_KEY.format(get_minute())
+        pipe.hincrby(COUNTERS_KEY, "orders_synced_total", num_synced)
+        pipe.incrby(key, num_synced)
+        pipe.expire(key, SYNCED_TTL)
+
+
+@fails_safe(False)
+def record_stats(stats):
+    """ Records the stats of a request
+    """
+    pipe = get_connection().pipeline(transaction=False)
+    add_stats(pipe, stats)
+
+    # an empty pipeline doesn't make a round trip
+    pipe.execute()
+    return True
+
+
+@fails_safe(False)
+def record_job(job, performed, stats=None):
+    """ Records the outcome, latencies, and stats of a job (in one round trip)
+    """
+    pipe = get_connection().pipeline(transaction=False)
+    status = "finished" if performed else "failed"
+    pipe.hincrby(COUNTERS_KEY, get_series("rq_jobs_total", status=status), 1)
+    labels = {"func": job.func_name}
+
+    if job.enqueued_at and job.started_at:
+        waited = (job.started_at - job.enqueued_at).total_seconds()
+        observe(pipe, "rq_job_wait_seconds", max(waited, 0), **labels)
+
+    if job.started_at and job.ended_at:
+        ran = (job.ended_at - job.started_at).total_seconds()
+        observe(pipe, "rq_job_run_seconds", max(ran, 0), **labels)
+
+    if stats:
+        add_stats(pipe, stats)
+
+    pipe.execute()
+    return True
+
+
+def sort_key(series):
+    """ Sorts histogram buckets numerically (so `le="5"` precedes `le="15"`)
+    """
+    name, _, labels = series.partition("{")
+    le = LE_REGEX.search(labels)
+    bound = float(le.group(1)) if le else 0
+    return (name, LE_REGEX.sub("", labels), bound)
+
+
+def get_name(series):
+    """
+    >>> get_name('rq_job_run_seconds_bucket{le="0.5"}')
+    'rq_job_run_seconds'
+    """
+    name = series.partition("{")[0]
+
+    for suffix in HISTOGRAM_SUFFIXES:
+        base = name[: -len(suffix)]
+
+        if name.endswith(suffix) and METRICS.get(base, ("",))[0] == "histogram":
+            name = base
+            break
+
+    return name
+
+
+def gen_lines(samples):
+    by_name = {}
+
+    for series, value in samples.items():
+        by_name.setdefault(get_name(series), {})[series] = value
+
+    for name, (kind, description) in METRICS.items():
+        series = by_name.get(name)
+
+        if series:
+            yield f"# HELP {name} {description}"
+            yield f"# TYPE {name} {kind}"
+
+            for key in sorted(series, key=sort_key):
+                yield f"{key} {series[key]}"
+
+
+@fails_safe()
+def render():
+    """ Renders all metrics in the Prometheus text format
+
+    The gauges are read directly from rq's keys so that a scrape costs two
+    round trips no matter how many jobs are queued.
+    """
+    conn = get_connection()
+    queue_keys = sorted(q.decode(ENCODING) for q in conn.smembers(QUEUES_KEY))
+    pipe = conn.pipeline(transaction=False)
+    pipe.hgetall(COUNTERS_KEY)
+    pipe.scard(WORKERS_KEY)
+    pipe.get(SYNCED_KEY.format(get_minute() - 1))
+
+    for key in queue_keys:
+        pipe.llen(key)
+
+    counters, num_workers, num_synced, *depths = pipe.execute()
+    samples = {k.decode(ENCODING): v.decode(ENCODING) for k, v in counters.items()}
+    samples["rq_workers"] = num_workers
+    samples["orders_synced_per_minute"] = int(num_synced or 0)
+
+    for key, depth in zip(queue_keys, depths):
+        queue = key.split(":", 2)[-1]
+        samples[get_series("rq_queue_depth", queue=queue)] = depth
+
+    return "\n".join(gen_lines(samples)) + "\n"
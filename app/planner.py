@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+    app.planner
+    ~~~~~~~~~~~
+
+    Provides a dry run (plan) mode for the sync. While planning, every read
+    (PriceCloser, Cloze, and the order index) happens as usual, but Cloze writes
+    and sync sleeps are only recorded. The plan then estimates how many upstream
+    calls and how long the real sync would take.
+"""
+import json
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+
+from flask import g, has_request_context
+
+from app.budget import get_current
+
+# the plan of the current job (see `budget.get_current`)
+current_plan = ContextVar("current_plan", default=None)
+
+
+def get_payload_hash(payload):
+    """
+    >>> get_payload_hash({"name": "1", "stage": "done"})
+    '7694e83bdfaacb62'
+    """
+    dumped = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return sha256(dumped).hexdigest()[:16]
+
+
+def get_unique_ids(resource, payload):
+    """ Gets the ids `get_from_cloze` would find a created record by
+    """
+    if resource == "people":
+        unique_ids = [email["value"] for email in payload.get("emails") or []]
+    else:
+        unique_ids = [
+            f"{link['source']}:{link['uniqueid']}"
+            for link in payload.get("appLinks") or []
+        ]
+
+    return unique_ids
+
+
+class Plan(object):
+    def __init__(self):
+        self.operations = []
+        self.created = {}
+        self.reads = 0
+        self.read_seconds = 0
+        self.sleep_seconds = 0
+
+    def record(self, resource, verb, payload):
+        operation = {
+            "resource": resource,
+            "verb": verb,
+            "name": payload.get("name"),
+            "hash": get_payload_hash(payload),
+        }
+
+        self.operations.append(operation)
+
+        if verb == "create":
+            for unique_id in get_unique_ids(resource, payload):
+                self.created[(resource, unique_id)] = payload
+
+    def lookup(self, resource, unique_id):
+        return self.created.get((resource, unique_id))
+
+    def record_read(self, seconds):
+        self.reads += 1
+        self.read_seconds += seconds
+
+    def summarize(self):
+        writes = {}
+
+        for operation in self.operations:
+            key = f"{operation['resource']} {operation['verb']}"
+            writes[key] = writes.get(key, 0) + 1
+
+        num_writes = len(self.operations)
+        call_seconds = self.read_seconds / self.reads if self.reads else 0
+
+        # writes are assumed to take as long as the average read
+        seconds = self.read_seconds + num_writes * call_seconds + self.sleep_seconds
+
+        return {
+            "operations": self.operations,
+            "writes": writes,
+            "num_reads": self.reads,
+            "num_writes": num_writes,
+            "num_calls": self.reads + num_writes,
+            "est_seconds": round(seconds, 3),
+        }
+
+
+def get_plan():
+    return get_current(current_plan, "cloze_plan")
+
+
+def is_planning():
+    return get_plan() is not None
+
+
+@contextmanager
+def planning():
+    plan = Plan()
+
+    if has_request_context():
+        g.cloze_plan = plan
+
+        try:
+            yield plan
+        finally:
+            g.cloze_plan = None
+    else:
+        token = current_plan.set(plan)
+
+        try:
+            yield plan
+        finally:
+            current_plan.reset(token)
+
+
+def lookup(resource, unique_id):
+    """ Gets a record the plan created (or None)
+    """
+    plan = get_plan()
+    return plan.lookup(resource, unique_id) if plan else None
+
+
+def sleep(seconds):
+    """ Sleeps (or only records the sleep while planning)
+    """
+    plan = get_plan()
+
+    if plan:
+        plan.sleep_seconds += seconds
+    else:
+        time.sleep(seconds)
+
+
+def response_hook(r, *args, **kwargs):
+    """ A `requests` response hook that times the reads made while planning
+    """
+    plan = get_plan()
+
+    if plan:
+        plan.record_read(r.elapsed.total_seconds())
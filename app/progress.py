@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+    app.progress
+    ~~~~~~~~~~~~
+
+    Provides job status notifications. Workers publish each status change of a
+    job to redis, and each web process shares a single redis subscription among
+    every request waiting on a job (a long-poll of `/v1/result/<job_id>` or its
+    server-sent `events` stream). So a waiting client costs an idle greenlet
+    rather than a poll loop.
+"""
+import json
+
+from queue import Queue, Empty
+from threading import Lock, Thread
+from time import monotonic
+
+import pygogo as gogo
+
+from config import Config
+from app.connection import get_connection, fails_safe
+from app.dashboard import decode
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+RESULT_MAX_WAIT = Config.RESULT_MAX_WAIT
+RESULT_HEARTBEAT = Config.RESULT_HEARTBEAT
+
+CHANNEL = "job:{}:status"
+DONE_STATUSES = {"finished", "failed", "job not found"}
+
+
+@fails_safe(0)
+def publish(job, status):
+    """
+    Returns:
+        (int): The number of web processes watching the job
+    """
+    return get_connection().publish(CHANNEL.format(job.id), status)
+
+
+@fails_safe("job not found")
+def get_status(job_id):
+    from app.jobs import get_queue
+
+    job = get_queue().fetch_job(job_id)
+    return job.get_status() if job else "job not found"
+
+
+class Listener(object):
+    """ Relays the published statuses to the waiting requests (one queue per
+    request) from a background thread (a greenlet under gevent)
+    """
+
+    def __init__(self):
+        self.watchers = {}
+        self.lock = Lock()
+        self.thread = None
+
+    def watch(self, job_id):
+        watcher = Queue()
+
+        with self.lock:
+            self.watchers.setdefault(job_id, set()).add(watcher)
+
+            if not (self.thread and self.thread.is_alive()):
+                self.thread = Thread(target=self.listen, daemon=True)
+                self.thread.start()
+
+        return watcher
+
+    def unwatch(self, job_id, watcher):
+        with self.lock:
+            watchers = self.watchers.get(job_id, set())
+            watchers.discard(watcher)
+
+            if not watchers:
+                self.watchers.pop(job_id, None)
+
+    def listen(self):
+        from redis.exceptions import RedisError
+
+        prefix, suffix = CHANNEL.split("{}")
+        pubsub = get_connection().pubsub(ignore_subscribe_messages=True)
+
+        try:
+            pubsub.psubscribe(CHANNEL.format("*"))
+
+            for message in pubsub.listen():
+                job_id = decode(message["channel"])[len(prefix) : -len(suffix)]
+
+                with self.lock:
+                    watchers = list(self.watchers.get(job_id, []))
+
+                for watcher in watchers:
+                    watcher.put(decode(message["data"]))
+        except RedisError as e:
+            # the watchers fall back to checking the status every heartbeat
+            logger.warning(f"Stopped listening for job statuses: {e}")
+        finally:
+            pubsub.close()
+
+
+listener = Listener()
+
+
+def gen_statuses(job_id, timeout=RESULT_MAX_WAIT, heartbeat=RESULT_HEARTBEAT):
+    """ Generates a job's status and then each status change until the job is
+    done (or `timeout` seconds pass)
+
+    Yields:
+        (str): The job status (or None at each heartbeat without a change)
+    """
+    watcher = listener.watch(job_id)
+    deadline = monotonic() + timeout
+
+    try:
+        # only check after watching, so no status change goes unnoticed
+        status = get_status(job_id)
+        yield status
+
+        while status not in DONE_STATUSES and monotonic() < deadline:
+            try:
+                wait = min(heartbeat, deadline - monotonic())
+                published = watcher.get(timeout=max(wait, 0))
+            except Empty:
+                # in case the notification was missed (e.g., redis hiccuped)
+                published = get_status(job_id)
+
+            changed = published != status
+            status = published
+            yield status if changed else None
+    finally:
+        listener.unwatch(job_id, watcher)
+
+
+def wait(job_id, timeout=RESULT_MAX_WAIT):
+    """ Waits for a job to be done (or `timeout` seconds to pass)
+
+    Returns:
+        (str): The job status
+    """
+    status = None
+
+    for published in gen_statuses(job_id, min(timeout, RESULT_MAX_WAIT)):
+        status = published or status
+
+    return status
+
+
+def gen_events(job_id, get_result, timeout=None):
+    """ Generates a job's server-sent events: a `status` event on each status
+    change (and a comment at each heartbeat to keep the connection open), then a
+    `result` event once the job is done
+    """
+    status = None
+
+    for published in gen_statuses(job_id, timeout or float("inf")):
+        if published:
+            status = published
+            data = json.dumps({"job_id": job_id, "job_status": status})
+            yield f"event: status\ndata: {data}\n\n"
+        else:
+            yield ": heartbeat\n\n"
+
+    if status in DONE_STATUSES:
+        data = json.dumps(get_result(job_id), default=str)
+        yield f"event: result\ndata: {data}\n\n"
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+    app.scheduler
+    ~~~~~~~~~~~~~
+
+    Provides a scheduler that periodically enqueues an incremental sync (from
+    the `next_start_date` watermark to today).
+
+    Any number of schedulers may run (e.g., on several dynos). Only the one
+    holding the redis lock fires, syncs start `interval` plus a random jitter
+    apart, and a sync is skipped while the previous one is still queued or
+    running.
+"""
+import time
+import random
+
+from uuid import uuid4
+
+import pygogo as gogo
+
+from config import Config
+from app import breaker, jobs
+from app.connection import get_connection, fails_safe
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+SYNC_INTERVAL = Config.SYNC_INTERVAL
+SYNC_JITTER = Config.SYNC_JITTER
+SCHEDULER_POLL = Config.SCHEDULER_POLL
+DATE_FORMAT = Config.DATE_FORMAT
+
+# the date the next incremental sync starts from
+WATERMARK_KEY = "sync:next_start_date"
+
+# the token of the scheduler allowed to fire
+LOCK_KEY = "scheduler:lock"
+
+# epoch time of the next sync
+NEXT_RUN_KEY = "scheduler:next-run"
+
+# id of the last enqueued sync job
+LAST_JOB_KEY = "scheduler:last-job"
+
+ENCODING = "utf-8"
+
+# only extend/release the lock if this scheduler still holds it
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+@fails_safe()
+def get_next_start_date():
+    value = get_connection().get(WATERMARK_KEY)
+    return value.decode(ENCODING) if value else None
+
+
+@fails_safe(False)
+def set_next_start_date(end_date):
+    return get_connection().set(WATERMARK_KEY, end_date.strftime(DATE_FORMAT))
+
+
+def hold_lock(token, ttl):
+    """ Acquires (or renews) the scheduler lock
+
+    Returns:
+        (bool): True if this scheduler holds the lock
+    """
+    conn = get_connection()
+    acquired = conn.set(LOCK_KEY, token, nx=True, ex=ttl)
+    return bool(acquired or conn.eval(RENEW_SCRIPT, 1, LOCK_KEY, token, ttl))
+
+
+@fails_safe(0)
+def release_lock(token):
+    return get_connection().eval(RELEASE_SCRIPT, 1, LOCK_KEY, token)
+
+
+def is_running(job_id):
+    """ Checks if a sync job is still queued or running
+    """
+    from rq.job import Job
+    from rq.exceptions import NoSuchJobError
+
+    try:
+        job = Job.fetch(job_id, connection=get_connection())
+    except NoSuchJobError:
+        status = None
+    else:
+        status = job.get_status()
+
+    return status in {"queued", "started", "deferred", "scheduled"}
+
+
+def schedule_next(interval=SYNC_INTERVAL, jitter=SYNC_JITTER):
+    # jitter keeps the syncs from lining up with other periodic upstream load
+    next_run = time.time() + interval + random.uniform(0, jitter)
+    get_connection().set(NEXT_RUN_KEY, next_run)
+    return next_run
+
+
+def fire(**kwargs):
+    """ Enqueues an incremental sync unless the previous one is still going
+
+    Returns:
+        (obj): The enqueued job (or None)
+    """
+    from app.api import transfer_orders
+
+    conn = get_connection()
+    last_job_id = conn.get(LAST_JOB_KEY)
+
+    if last_job_id and is_running(last_job_id.decode(ENCODING)):
+        logger.info("Skipping sync since the previous sync is still running.")
+        job = None
+    else:
+        job = jobs.enqueue(transfer_orders, enqueue=True, **kwargs)
+        conn.set(LAST_JOB_KEY, job.id)
+        logger.info(f"Enqueued sync job {job.id}.")
+
+    return job
+
+
+def tick(token, interval=SYNC_INTERVAL, jitter=SYNC_JITTER, poll=SCHEDULER_POLL):
+    """ Fires if this scheduler holds the lock and a sync is due
+
+    Returns:
+        (bool): True if this scheduler holds the lock
+    """
+    # the lock outlives a few missed polls so a slow tick doesn't lose it
+    leader = hold_lock(token, poll * 3)
+
+    if leader:
+        # probes (and then requeues) the jobs parked by an open breaker
+        breaker.resume()
+        next_run = get_connection().get(NEXT_RUN_KEY)
+
+        if next_run is None or float(next_run) <= time.time():
+            fire()
+            schedule_next(interval, jitter)
+
+    return leader
+
+
+def run(interval=SYNC_INTERVAL, jitter=SYNC_JITTER, poll=SCHEDULER_POLL):
+    """ Runs the scheduler until interrupted
+    """
+    from redis.exceptions import RedisError
+
+    token = uuid4().hex
+    leader = False
+    logger.info(f"Scheduling a sync every {interval}s (+ up to {jitter}s)...")
+
+    try:
+        while True:
+            try:
+                is_leader = tick(token, interval, jitter, poll)
+            except RedisError as e:
+                logger.warning(f"Scheduler tick failed: {e}")
+                is_leader = False
+
+            if is_leader != leader:
+                verb = "Acquired" if is_leader else "Lost"
+                logger.info(f"{verb} the scheduler lock.")
+                leader = is_leader
+
+            time.sleep(poll)
+    finally:
+        release_lock(token)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+    app.snapshot
+    ~~~~~~~~~~~~
+
+    Provides an append-only, memory-mapped store of PriceCloser orders so that
+    settled (older) date ranges can be read from disk instead of OpenCart.
+
+    Each record is a fixed size header (payload length, `date_added` date, and
+    `order_id`) followed by the JSON encoded (trimmed) order. Only the headers
+    are read to build the `order_id` and `date_added` indexes. Newer versions of
+    an order are appended and replace older ones in the index.
+"""
+import os
+import json
+import mmap
+import struct
+
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import date, timedelta
+from fcntl import flock, LOCK_EX, LOCK_UN
+from os import path as p
+from threading import RLock
+
+import pygogo as gogo
+
+from flask import current_app, has_app_context
+
+from config import Config
+from app.jobs import trim_order
+
+logger = gogo.Gogo(__name__, monolog=True).logger
+
+SNAPSHOT_SETTLED_DAYS = Config.SNAPSHOT_SETTLED_DAYS
+DATE_FORMAT = Config.DATE_FORMAT
+ENCODING = "utf-8"
+
+# payload length, date (YYYY-MM-DD), and order id (space padded)
+HEADER = struct.Struct(">I10s16s")
+DATA_FILENAME = "orders.dat"
+COVERAGE_FILENAME = "coverage.json"
+LOCK_FILENAME = "orders.lock"
+
+stores = {}
+
+
+def get_settled_date(today=None):
+    """ Orders added on or before this date are assumed to no longer change
+
+    >>> get_settled_date(date(2020, 3, 31))
+    datetime.date(2020, 3, 1)
+    """
+    return (today or date.today()) - timedelta(days=SNAPSHOT_SETTLED_DAYS)
+
+
+def merge_ranges(ranges):
+    """
+    >>> merge_ranges([("2020-01-05", "2020-01-09"), ("2020-01-01", "2020-01-04")])
+    [['2020-01-01', '2020-01-09']]
+    >>> merge_ranges([("2020-01-01", "2020-01-02"), ("2020-01-04", "2020-01-05")])
+    [['2020-01-01', '2020-01-02'], ['2020-01-04', '2020-01-05']]
+    """
+    merged = []
+
+    for start, end in sorted(map(list, ranges)):
+        if merged:
+            last_end = date.fromisoformat(merged[-1][1])
+            adjacent = date.fromisoformat(start) <= last_end + timedelta(days=1)
+        else:
+            adjacent = False
+
+        if adjacent:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
+
+
+class SnapshotStore(object):
+    def __init__(self, dirname):
+        os.makedirs(dirname, exist_ok=True)
+        self.data_path = p.join(dirname, DATA_FILENAME)
+        self.coverage_path = p.join(dirname, COVERAGE_FILENAME)
+        self.lock_path = p.join(dirname, LOCK_FILENAME)
+        self.offsets = {}
+        self.dates = []
+        self.size = 0
+        self.map = None
+        self.lock = RLock()
+        open(self.data_path, "ab").close()
+
+    @contextmanager
+    def locked(self):
+        """ Serializes writes across threads and processes (e.g., gunicorn
+        workers and rq workers sharing a dyno's disk)
+        """
+        with self.lock, open(self.lock_path, "w") as f:
+            flock(f, LOCK_EX)
+
+            try:
+                yield
+            finally:
+                flock(f, LOCK_UN)
+
+    def refresh(self):
+        """ Indexes any records appended (by any process) since the last refresh
+        """
+        with self.lock:
+            size = p.getsize(self.data_path)
+
+            if size == self.size:
+                return
+
+            with open(self.data_path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            offset = self.size
+
+            while offset + HEADER.size <= size:
+                length, day, order_id = HEADER.unpack_from(self.map, offset)
+                order_id = order_id.decode(ENCODING).rstrip()
+
+                if offset + HEADER.size + length > size:
+                    # a partially written record
+                    break
+
+                if order_id not in self.offsets:
+                    insort(self.dates, (day.decode(ENCODING), order_id))
+
+                self.offsets[order_id] = offset
+                offset += HEADER.size + length
+
+            self.size = offset
+
+    def read(self, offset):
+        length = HEADER.unpack_from(self.map, offset)[0]
+        start = offset + HEADER.size
+        return json.loads(self.map[start : start + length])
+
+    def get(self, order_id):
+        self.refresh()
+        offset = self.offsets.get(str(order_id))
+        return None if offset is None else self.read(offset)
+
+    def get_range(self, start, end):
+        """ Gets the orders added from `start` to `end` (inclusive dates)
+        """
+        self.refresh()
+        start, end = start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)
+        first = bisect_left(self.dates, (start, ""))
+        last = bisect_right(self.dates, (end, "\uffff"))
+        return [
+            self.read(self.offsets[order_id]) for _, order_id in self.dates[first:last]
+        ]
+
+    def add(self, pricecloser_orders):
+        records = []
+
+        for pricecloser_order in pricecloser_orders:
+            payload = json.dumps(trim_order(pricecloser_order)).encode(ENCODING)
+            day = pricecloser_order["date_added"][:10].encode(ENCODING)
+            order_id = str(pricecloser_order["order_id"]).ljust(16).encode(ENCODING)
+            records.append(HEADER.pack(len(payload), day, order_id) + payload)
+
+        if records:
+            with self.locked(), open(self.data_path, "ab") as f:
+                f.write(b"".join(records))
+
+        return len(records)
+
+    def get_coverage(self):
+        try:
+            with open(self.coverage_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def get_covered_date(self, start):
+        """ Gets the last date through which every order added since `start` is
+        stored (or None)
+        """
+        start = start.strftime(DATE_FORMAT)
+        covered = [e for s, e in self.get_coverage() if s <= start <= e]
+        return date.fromisoformat(covered[0]) if covered else None
+
+    def mark(self, start, end):
+        """ Records that every order added from `start` to `end` is stored
+        """
+        new_range = [start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT)]
+
+        with self.locked():
+            coverage = merge_ranges(self.get_coverage() + [new_range])
+            tmp_path = f"{self.coverage_path}.tmp"
+
+            with open(tmp_path, "w") as f:
+                json.dump(coverage, f)
+
+            os.replace(tmp_path, self.coverage_path)
+
+    def save(self, pricecloser_orders, start, end):
+        """ Stores a fetched range of orders (up to the settled date)
+        """
+        end = min(end, get_settled_date())
+
+        if start <= end:
+            last_day = end.strftime(DATE_FORMAT)
+            settled = (
+                o for o in pricecloser_orders if o["date_added"][:10] <= last_day
+            )
+            num_orders = self.add(settled)
+            self.mark(start, end)
+            logger.debug(f"Stored {num_orders} orders from {start} to {end}.")
+
+
+def get_store():
+    """ Gets the store in the app's CACHE_DIR (or None outside of an app context)
+    """
+    dirname = current_app.config.get("CACHE_DIR") if has_app_context() else None
+
+    if dirname and dirname not in stores:
+        stores[dirname] = SnapshotStore(p.join(dirname, "snapshots"))
+
+    return stores.get(dirname)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+    app.standin
+    ~~~~~~~~~~~
+
+    Provides a local stand-in for the Cloze and OpenCart (pricecloser.com) REST
+    Admin APIs with injectable latency, error rates, and eventual consistency
+"""
+import time
+import random
+
+from collections import Counter
+from datetime import date, timedelta
+from threading import Lock
+
+from flask import Flask, jsonify, request
+
+CLOZE_PREFIX = "/cloze/v1"
+OPENCART_PREFIX = "/opencart/api/rest_admin"
+DATE_FORMAT = "%Y-%m-%d"
+SOURCE = "pricecloser.com"
+
+
+def gen_orders(num_orders, num_products=3, customers_per_order=0.3, end=None):
+    """ Generates synthetic PriceCloser orders (roughly one per day going back
+    from `end`)
+    """
+    end = end or date.today()
+    num_customers = max(1, int(num_orders * customers_per_order))
+
+    for num in range(1, num_orders + 1):
+        customer_num = num % num_customers + 1
+        guest = not customer_num % 5
+        date_added = end - timedelta(days=num_orders - num)
+
+        yield {
+            "order_id": str(num),
+            "customer_id": "0" if guest else str(customer_num),
+            "email": f"customer{customer_num}@example.com",
+            "firstname": "Customer",
+            "lastname": str(customer_num),
+            "telephone": f"801555{customer_num:04d}"[-10:],
+            "order_status": "Processed" if num % 3 else "Pending",
+            "order_status_id": "15" if num % 3 else "1",
+            "date_added": f"{date_added.strftime(DATE_FORMAT)} 10:00:00",
+            "total": f"{num * 7 % 500 + 10}.00",
+            "products": [
+                {"product_id": str((num + pos) % 50 + 1)}
+                for pos in range(1 + num % num_products)
+            ],
+        }
+
+
+class Store(object):
+    """ Records that only become visible `delay` seconds after being written
+    """
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.records = {}
+        self.lock = Lock()
+
+    def get(self, key):
+        visible_at, record = self.records.get(key, (0, None))
+        return record if visible_at <= time.time() else None
+
+    def set(self, key, record):
+        with self.lock:
+            self.records[key] = (time.time() + self.delay, record)
+
+    def values(self):
+        now = time.time()
+        return [
+            record for visible_at, record in self.records.values() if visible_at <= now
+        ]
+
+
+def merge_fields(old_fields, new_fields):
+    fields = {field["id"]: field for field in old_fields}
+    fields.update((field["id"], field) for field in new_fields)
+    return list(fields.values())
+
+
+def merge(record, updates):
+    merged = {**record, **updates}
+    old_fields = record.get("customFields", [])
+    merged["customFields"] = merge_fields(old_fields, updates.get("customFields", []))
+    return merged
+
+
+# (url rule, handler, methods)
+ROUTES = [
+    (f"{CLOZE_PREFIX}/people/get", "get_person", ["GET"]),
+    (f"{CLOZE_PREFIX}/projects/get", "get_project", ["GET"]),
+    (f"{CLOZE_PREFIX}/projects/find", "find_projects", ["GET"]),
+    (f"{CLOZE_PREFIX}/people/<verb>", "post_person", ["POST"]),
+    (f"{CLOZE_PREFIX}/projects/<verb>", "post_project", ["POST"]),
+    (f"{OPENCART_PREFIX}/orders/<order_id>", "get_order", ["GET"]),
+    (
+        f"{OPENCART_PREFIX}/orders/details/added_from/<start>/added_to/<end>",
+        "get_orders",
+        ["GET"],
+    ),
+    (f"{OPENCART_PREFIX}/products/<product_id>", "get_product", ["GET"]),
+]
+
+
+class Upstreams(object):
+    """ The state and route handlers of the stand-in Cloze and OpenCart
+    """
+
+    def __init__(self, orders, latency=0, error_rate=0, consistency_delay=0, seed=None):
+        self.orders = orders
+        self.orders_by_id = {str(order["order_id"]): order for order in orders}
+        self.people = Store(consistency_delay)
+        self.projects = Store(consistency_delay)
+        self.calls = Counter()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rand = random.Random(seed)
+        self.direct_ids = iter(range(1, 10 ** 9))
+
+    def failed(self):
+        return self.error_rate and self.rand.random() < self.error_rate
+
+    def cloze_response(self, status_code=200, **kwargs):
+        if self.failed():
+            resp = {"errorcode": 1, "message": "Service unavailable"}
+            status_code = 503
+        else:
+            resp = {"errorcode": 0, **kwargs}
+
+        return jsonify(resp), status_code
+
+    def opencart_response(self, data=None, error=None):
+        if self.failed():
+            return jsonify({"error": ["Service unavailable"], "data": []}), 503
+        elif error:
+            return jsonify({"error": [error], "data": []}), 404
+        else:
+            return jsonify({"error": [], "data": data})
+
+    def count_and_wait(self):
+        self.calls[f"{request.method} {request.url_rule}"] += 1
+        time.sleep(self.latency)
+
+    def get_person(self):
+        person = self.people.get(request.args["uniqueid"])
+
+        if person:
+            return self.cloze_response(person=person)
+        else:
+            return self.cloze_response(errorcode=404, message="Person not found")
+
+    def get_project(self):
+        project = self.projects.get(request.args["uniqueid"])
+
+        if project:
+            return self.cloze_response(project=project)
+        else:
+            return self.cloze_response(errorcode=404, message="Project not found")
+
+    def find_projects(self):
+        pagesize = int(request.args.get("pagesize", 10))
+        pagenumber = int(request.args.get("pagenumber", 1))
+        available = self.projects.values()
+        start = (pagenumber - 1) * pagesize
+        page = available[start : start + pagesize]
+        return self.cloze_response(projects=page, availablecount=len(available))
+
+    def post_record(self, store, uniqueid, record, verb, name):
+        existing = store.get(uniqueid)
+
+        if verb == "update" and existing:
+            store.set(uniqueid, merge(existing, record))
+        elif verb == "update":
+            return self.cloze_response(errorcode=404, message=f"{name} not found")
+        else:
+            store.set(uniqueid, {**record, "direct": str(next(self.direct_ids))})
+
+        return self.cloze_response()
+
+    def post_person(self, verb):
+        person = request.get_json(force=True)
+        email = person.get("emails", [{}])[0].get("value")
+        return self.post_record(self.people, email, person, verb, "Person")
+
+    def post_project(self, verb):
+        project = request.get_json(force=True)
+        uniqueid = f"{SOURCE}:{project['appLinks'][0]['uniqueid']}"
+        return self.post_record(self.projects, uniqueid, project, verb, "Project")
+
+    def get_order(self, order_id):
+        order = self.orders_by_id.get(order_id)
+        error = None if order else f"Order {order_id} not found"
+        return self.opencart_response(order, error)
+
+    def get_orders(self, start, end):
+        data = [o for o in self.orders if start <= o["date_added"][:10] < end]
+        return self.opencart_response(data)
+
+    def get_product(self, product_id):
+        manufacturer = f"Manufacturer {int(product_id) % 7}"
+        data = {"product_id": product_id, "manufacturer": manufacturer}
+        return self.opencart_response(data)
+
+
+def create_standin(
+    orders=None, latency=0, error_rate=0, consistency_delay=0, seed=None, **kwargs
+):
+    """ Creates the stand-in app
+
+    Args:
+        orders (List[dict]): The PriceCloser orders to serve (default: 100
+            generated orders).
+        latency (float): Seconds to wait before answering each request.
+        error_rate (float): Fraction of requests that fail (0 to 1).
+        consistency_delay (float): Seconds before a Cloze write is visible.
+        seed (int): Random seed for error injection.
+
+    Returns:
+        (obj): Flask app with a `standin` attribute holding the upstream state
+            and a `calls` Counter keyed by endpoint
+    """
+    orders = list(gen_orders(100) if orders is None else orders)
+    upstreams = Upstreams(orders, latency, error_rate, consistency_delay, seed)
+    standin = Flask(__name__)
+    standin.standin = {
+        "people": upstreams.people,
+        "projects": upstreams.projects,
+        "orders": orders,
+    }
+    standin.calls = upstreams.calls
+    standin.before_request(upstreams.count_and_wait)
+
+    for rule, name, methods in ROUTES:
+        standin.add_url_rule(rule, name, getattr(upstreams, name), methods=methods)
+
+    return standin
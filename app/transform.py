@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+    app.transform
+    ~~~~~~~~~~~~~
+
+    Provides a batch version of `create_customer_data` and `create_order_data`
+    (and of the customer ids `sync_orders` groups orders by).
+
+    The orders are transposed into columns once, and each derived column
+    (stages, customer ids, appLinks urls, totals) is computed in a single pass.
+    Mappings only run once per distinct value (e.g., there are only a handful of
+    order statuses), so only the final payload assembly is done per order.
+"""
+from operator import methodcaller
+
+from app import api
+
+ORDER_COLUMNS = ["order_id", "customer_id", "email", "firstname", "lastname"]
+ORDER_COLUMNS += ["telephone", "date_added", "total"]
+
+
+def get_columns(records, fields):
+    """ Transposes records into columns (a missing field is None)
+
+    >>> get_columns([{"a": 1, "b": 2}, {"a": 3}], ["a", "b"])
+    {'a': (1, 3), 'b': (2, None)}
+    >>> get_columns([], ["a", "b"])
+    {'a': (), 'b': ()}
+    """
+    return {field: tuple(map(methodcaller("get", field), records)) for field in fields}
+
+
+def map_column(func, column):
+    """ Applies `func` once per distinct value of a column
+
+    >>> map_column(str.upper, ["a", "b", "a"])
+    ['A', 'B', 'A']
+    """
+    table = {value: func(value) for value in set(column)}
+    return list(map(table.__getitem__, column))
+
+
+def get_order_columns(pricecloser_orders):
+    """ Gets the columns both payloads use (order ids as strings and statuses
+    with their defaults applied)
+    """
+    columns = get_columns(pricecloser_orders, ORDER_COLUMNS)
+    columns["order_id"] = list(map(str, columns["order_id"]))
+    columns["order_status"] = list(map(api.get_order_status, pricecloser_orders))
+    return columns
+
+
+def get_customer_ids(customer_ids, emails):
+    """
+    >>> get_customer_ids(["5", "0"], ["a@b.com", "c@d.com"])
+    (['5', 'c@d.com'], [False, True])
+    """
+    guests = map_column(lambda customer_id: customer_id in {"0", 0}, customer_ids)
+    ids = [str(e if g else c) for c, e, g in zip(customer_ids, emails, guests)]
+    return ids, guests
+
+
+def gen_customer_data(pricecloser_orders, cloze_area="people", columns=None):
+    """ Generates the `create_customer_data` payload of each order
+    """
+    columns = columns or get_order_columns(pricecloser_orders)
+    order_ids = columns["order_id"]
+    stage = lambda status: api.get_stage(status, cloze_area)
+    stages = map_column(stage, columns["order_status"])
+    customer_ids, guests = get_customer_ids(columns["customer_id"], columns["email"])
+    names = [f"{f} {l}" for f, l in zip(columns["firstname"], columns["lastname"])]
+    headlines = [f"PriceCloser Customer - Order {o}" for o in order_ids]
+    order_url = f"{api.PRICECLOSER_APPLINK_BASE_URL}sale/order/info&order_id="
+    customer_url = (
+        f"{api.PRICECLOSER_APPLINK_BASE_URL}customer/customer/edit&customer_id="
+    )
+    urls = [
+        f"{order_url}{o}" if g else f"{customer_url}{c}"
+        for o, c, g in zip(order_ids, customer_ids, guests)
+    ]
+
+    rows = zip(
+        names,
+        headlines,
+        stages,
+        columns["telephone"],
+        columns["email"],
+        customer_ids,
+        urls,
+    )
+    segment = api.CLOZE_ACCOUNT_MAP["customer_segment"]
+    lead_source = api.CLOZE_ACCOUNT_MAP["lead_source"]
+
+    for name, headline, stage, telephone, email, customer_id, url in rows:
+        yield {
+            "name": name,
+            "headline": headline,
+            "stage": stage,
+            "shareTo": api.share_to,
+            "segment": segment,
+            "phones": [{"value": telephone}],
+            "emails": [{"value": email}],
+            "customFields": [
+                {"id": lead_source, "type": "keywords", "value": "website"}
+            ],
+            "appLinks": [
+                {
+                    "source": api.SOURCE,
+                    "uniqueid": customer_id,
+                    "label": "PriceCloser Customer",
+                    "url": url,
+                }
+            ],
+        }
+
+
+def gen_order_data(
+    pricecloser_orders, manufacturers=None, customers=None, columns=None
+):
+    """ Generates the `create_order_data` payload of each order
+
+    Args:
+        pricecloser_orders (List[dict]): The orders
+        manufacturers (List[str]): Each order's manufacturers (default: "")
+        customers (List[dict]): Each order's Cloze customer (or None)
+    """
+    columns = columns or get_order_columns(pricecloser_orders)
+    num_orders = len(pricecloser_orders)
+    order_ids = columns["order_id"]
+    stage = lambda status: api.get_stage(status, "projects")
+    stages = map_column(stage, columns["order_status"])
+    order_url = f"{api.PRICECLOSER_APPLINK_BASE_URL}sale/order/info&order_id="
+    urls = [f"{order_url}{o}" for o in order_ids]
+
+    account_map = api.CLOZE_ACCOUNT_MAP
+    planned_start = account_map.get("planned_start")
+    start_field = f"{account_map['start']}"
+
+    rows = zip(
+        order_ids,
+        columns["date_added"],
+        columns["total"],
+        columns["email"],
+        stages,
+        urls,
+        manufacturers or [""] * num_orders,
+        customers or [None] * num_orders,
+    )
+
+    for (
+        order_id,
+        date_added,
+        total,
+        email,
+        stage,
+        url,
+        _manufacturers,
+        customer,
+    ) in rows:
+        custom_fields = [
+            {"id": account_map["value"], "type": "currency", "value": total},
+            {"id": account_map["amount"], "type": "decimal", "value": total},
+            {"id": account_map["order_num"], "type": "text", "value": order_id},
+            {
+                "id": account_map["manufacturers"],
+                "type": "text",
+                "value": _manufacturers,
+            },
+        ]
+
+        if planned_start:
+            custom_fields.append(
+                {"id": planned_start, "type": "date", "value": date_added}
+            )
+
+        if customer:
+            custom_fields.append(
+                {
+                    "id": account_map["customer_link"],
+                    "type": "contact",
+                    "value": {"name": customer["name"], "email": email},
+                }
+            )
+
+        yield {
+            "name": order_id,
+            "summary": _manufacturers,
+            "importTo": api.import_to,
+            "projectTeam": [],
+            "stage": stage,
+            "segment": account_map["project_segment"],
+            start_field: date_added,
+            "customFields": custom_fields,
+            "appLinks": [
+                {
+                    "source": api.SOURCE,
+                    "uniqueid": order_id,
+                    "label": "PriceCloser Order",
+                    "url": url,
+                }
+            ],
+        }
+
+
+def gen_payloads(pricecloser_orders, manufacturers=None, customers=None):
+    """ Generates the Cloze payloads of a `get_pc_orders` result
+
+    Yields:
+        (tuple): The customer data and order data of each order
+    """
+    pricecloser_orders = list(pricecloser_orders)
+    columns = get_order_columns(pricecloser_orders)
+    customer_data = gen_customer_data(pricecloser_orders, columns=columns)
+    args = (pricecloser_orders, manufacturers, customers)
+    order_data = gen_order_data(*args, columns=columns)
+    return zip(customer_data, order_data)
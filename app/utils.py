@@ -20,9 +20,6 @@ import pygogo as gogo
 from flask import make_response, request
 from dateutil.relativedelta import relativedelta
 
-
-from meza import fntools as ft, convert as cv
-
 from app import cache
 
 logger = gogo.Gogo(__name__, monolog=True).logger
@@ -74,6 +71,9 @@ def responsify(mimetype, status_code=200, indent=2, sort_keys=True, **kwargs):
     Returns:
         (obj): Flask response
     """
+    # meza is slow to import and only needed once we actually respond
+    from meza import fntools as ft, convert as cv
+
     encoding = kwargs.get("encoding", ENCODING)
     options = {"indent": indent, "sort_keys": sort_keys, "ensure_ascii": False}
     kwargs["status"] = responses[status_code]
@@ -123,6 +123,23 @@ def parse(string):
     return parsed
 
 
+def gen_date_windows(start, end, days=31):
+    """ Splits an (inclusive) date range into consecutive (inclusive) windows
+
+    Examples:
+        >>> from datetime import date
+        >>> windows = gen_date_windows(date(2020, 1, 1), date(2020, 1, 10), 4)
+        >>> [(s.day, e.day) for s, e in windows]
+        [(1, 4), (5, 8), (9, 10)]
+    """
+    one_day = timedelta(days=1)
+
+    while start <= end:
+        window_end = min(start + timedelta(days=days) - one_day, end)
+        yield (start, window_end)
+        start = window_end + one_day
+
+
 def make_cache_key(*args, **kwargs):
     """ Creates a memcache key for a url and its query/form parameters
 
@@ -223,8 +240,8 @@ def uncache_header(response):
 
 
 # http://flask.pocoo.org/snippets/45/
-def get_mimetype(request):
-    best = request.accept_mimetypes.best_match(MIMETYPES)
+def get_mimetype(request, mimetypes=None):
+    best = request.accept_mimetypes.best_match(mimetypes or MIMETYPES)
 
     if not best:
         mimetype = "text/html"
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    app.webhooks
+    ~~~~~~~~~~~~
+
+    Provides verification and deduplication of PriceCloser order notifications
+"""
+import hmac
+
+from hashlib import sha256
+
+from config import Config
+from app.connection import get_connection, fails_safe
+
+PRICECLOSER_WEBHOOK_SECRET = Config.PRICECLOSER_WEBHOOK_SECRET
+WEBHOOK_DEDUPE_TTL = Config.WEBHOOK_DEDUPE_TTL
+
+SIGNATURE_HEADER = "X-Pricecloser-Signature"
+SIGNATURE_PREFIX = "sha256="
+EVENTS = {"order.created", "order.updated"}
+
+# order id and timestamp of each notification already enqueued
+RECEIVED_KEY = "webhook:pricecloser:{}:{}"
+
+
+def get_signature(body, secret=PRICECLOSER_WEBHOOK_SECRET):
+    """
+    >>> get_signature(b'{"order_id": 1}', "secret")[:12]
+    '9a4afa4a4026'
+    """
+    return hmac.new(secret.encode("utf-8"), body, sha256).hexdigest()
+
+
+def verify(body, signature, secret=PRICECLOSER_WEBHOOK_SECRET):
+    """ Checks that the raw request body was signed with the shared secret
+
+    >>> body = b'{"order_id": 1}'
+    >>> verify(body, get_signature(body, "secret"), "secret")
+    True
+    >>> verify(body, f"sha256={get_signature(body, 'secret')}", "secret")
+    True
+    >>> verify(body, get_signature(body, "other"), "secret")
+    False
+    """
+    if not (secret and signature):
+        return False
+
+    if signature.startswith(SIGNATURE_PREFIX):
+        signature = signature[len(SIGNATURE_PREFIX) :]
+
+    return hmac.compare_digest(get_signature(body, secret), signature)
+
+
+@fails_safe(True)
+def claim(order_id, timestamp, ttl=WEBHOOK_DEDUPE_TTL):
+    """ Records a notification
+
+    Returns:
+        (bool): True if the notification hasn't been received before (redis
+            errors count as new since resyncing an order is harmless)
+    """
+    key = RECEIVED_KEY.format(order_id, timestamp)
+    return bool(get_connection().set(key, 1, nx=True, ex=ttl))
+
+
+@fails_safe(0)
+def release(order_id, timestamp):
+    """ Forgets a notification (e.g., one whose sync couldn't be enqueued) so
+    that PriceCloser's retry of it goes through
+    """
+    return get_connection().delete(RECEIVED_KEY.format(order_id, timestamp))
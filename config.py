@@ -14,17 +14,37 @@
     ###########################################################################
 """
 from os import getenv, path as p
+from ast import literal_eval
 from datetime import timedelta
 from collections import namedtuple
+from types import SimpleNamespace
 
 import pygogo as gogo
 
-from pkutils import parse_module
-
 PARENT_DIR = p.abspath(p.dirname(__file__))
 DAYS_PER_MONTH = 30
 
-app = parse_module(p.join(PARENT_DIR, "app", "__init__.py"))
+
+def parse_metadata(filename, encoding="utf-8"):
+    """Reads the double underscored literals of a module without importing it
+    (a lighter weight alternative to `pkutils.parse_module`).
+    """
+    attrs = {}
+
+    with open(filename, encoding=encoding) as f:
+        for line in f:
+            if line.startswith("__") and " = " in line:
+                name, value = line.split(" = ", 1)
+
+                try:
+                    attrs[name.strip()] = literal_eval(value.strip())
+                except (ValueError, SyntaxError):
+                    pass
+
+    return SimpleNamespace(**attrs)
+
+
+app = parse_metadata(p.join(PARENT_DIR, "app", "__init__.py"))
 user = getenv("USER", "user")
 db_env_list = ["DATABASE_URL", "REDIS_URL", "MEMCACHIER_SERVERS", "REDISTOGO_URL"]
 
@@ -135,10 +155,18 @@ class Config(object):
     EMPTY_TIMEOUT = ROUTE_TIMEOUT * 10
     API_URL_PREFIX = "/v1"
     REPORT_MONTHS = 12
+    IMPORT_TIME_BUDGET = float(getenv("IMPORT_TIME_BUDGET", 0.5))
     DATE_FORMAT = "%Y-%m-%d"
     RQ_DASHBOARD_REDIS_URL = (
         getenv("REDIS_URL") or getenv("REDISTOGO_URL") or __DEF_REDIS_URL__
     )
+
+    # the benchmarks' and tests' own redis dbs (neither shares the app's)
+    BENCH_REDIS_URL = getenv("BENCH_REDIS_URL", f"{__DEF_REDIS_URL__}/15")
+    TEST_REDIS_URL = getenv("TEST_REDIS_URL", f"{__DEF_REDIS_URL__}/14")
+    WORKER_PRELOAD = getenv("WORKER_PRELOAD", "").lower() in {"1", "true"}
+    WORKER_MAX_JOBS = int(getenv("WORKER_MAX_JOBS", 500))
+    WORKER_MAX_MEMORY = int(getenv("WORKER_MAX_MEMORY", 384))
     RQ_DASHBOARD_USERNAME = getenv("RQ_DASHBOARD_USERNAME")
     RQ_DASHBOARD_PASSWORD = getenv("RQ_DASHBOARD_PASSWORD")
 
@@ -159,14 +187,121 @@ class Config(object):
     # Cloze variables
     CLOZE_API_KEY = getenv("CLOZE_API_KEY")
     CLOZE_EMAIL = getenv("CLOZE_EMAIL")
-    CLOZE_BASE_URL = "https://api.cloze.com/v1"
+    CLOZE_BASE_URL = getenv("CLOZE_BASE_URL", "https://api.cloze.com/v1")
     CLOZE_ACCOUNT_MAP = __CLOZE_ACCOUNT_MAPPINGS__[__CLOZE_ACCOUNT_ID__]
     CLOZE_STAGES = __CLOZE_STAGES__
+    RECONCILE_PAGE_SIZE = 100
+    EXPORT_WINDOW_DAYS = 31
+    SNAPSHOT_SETTLED_DAYS = int(getenv("SNAPSHOT_SETTLED_DAYS", 30))
+    QUEUE_STATS_TTL = get_seconds(5)
+    QUEUE_PAGE_SIZE = 50
+    QUEUE_MAX_PAGE_SIZE = 500
+
+    # max seconds a `/v1/result/<job_id>?wait=<seconds>` long-poll waits (under
+    # the router's 30 second timeout) and seconds between the checks (and
+    # server-sent event heartbeats) of a waiting request (see `app.progress`)
+    RESULT_MAX_WAIT = 25
+    RESULT_HEARTBEAT = 15
+
+    # max jobs a `POST /v1/results` lookup may include
+    RESULTS_MAX_JOBS = 10000
+    FAILED_JOB_GRACE = int(getenv("FAILED_JOB_GRACE", get_seconds(hours=6)))
+    FAILED_JOBS_MAXLEN = int(getenv("FAILED_JOBS_MAXLEN", 10000))
+
+    # How long (in seconds) redis keeps the results of successful jobs and the
+    # failed jobs themselves (rq defaults to 500 seconds and 1 year)
+    SYNC_RESULT_TTL = int(getenv("SYNC_RESULT_TTL", get_seconds(hours=1)))
+    SYNC_FAILURE_TTL = int(getenv("SYNC_FAILURE_TTL", get_seconds(days=3)))
+    JOB_TTLS = {
+        "default": {
+            "result_ttl": get_seconds(hours=1),
+            "failure_ttl": get_seconds(days=7),
+        },
+        "add_customer_and_order": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "add_customer_and_orders": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "update_order_stage": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "sync_order": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "sync_orders": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "sync_window": {
+            "result_ttl": SYNC_RESULT_TTL,
+            "failure_ttl": SYNC_FAILURE_TTL,
+        },
+        "reconcile_orders": {
+            "result_ttl": get_seconds(days=1),
+            "failure_ttl": get_seconds(days=7),
+        },
+    }
+
+    # seconds to wait between orders so Cloze can catch up (see
+    # `add_customer_and_order`)
+    SYNC_SLEEP = int(getenv("SYNC_SLEEP", 10))
+    SYNC_INTERVAL = int(getenv("SYNC_INTERVAL", get_seconds(minutes=15)))
+    SYNC_JITTER = int(getenv("SYNC_JITTER", 60))
+    SCHEDULER_POLL = 10
+
+    # seconds a customer lock lasts per order (on top of the sync sleep) and
+    # the max seconds to wait for it (see `app.locks`)
+    CUSTOMER_LOCK_TTL = int(getenv("CUSTOMER_LOCK_TTL", 60))
+    CUSTOMER_LOCK_WAIT = int(getenv("CUSTOMER_LOCK_WAIT", 60))
+
+    # how long a backfill's progress is kept and the max seconds a backfill
+    # window job may take (see `app.backfill`)
+    BACKFILL_TTL = get_seconds(days=7)
+    BACKFILL_JOB_TIMEOUT = int(getenv("BACKFILL_JOB_TIMEOUT", get_seconds(hours=2)))
+
+    # upstream failures (within `BREAKER_WINDOW` seconds) that open a circuit
+    # breaker, the seconds it stays open, and the max seconds a half-open probe
+    # may take (see `app.breaker`)
+    BREAKER_FAILURES = int(getenv("BREAKER_FAILURES", 5))
+    BREAKER_WINDOW = 60
+    BREAKER_COOLDOWN = int(getenv("BREAKER_COOLDOWN", 30))
+    BREAKER_PROBE_TTL = 30
+
+    # (connect, read) timeouts of each upstream's calls, the time budget of a
+    # request, the seconds a job keeps (out of its rq timeout) to report, and
+    # the least time worth starting an upstream call with (see `app.budget`)
+    UPSTREAM_CONNECT_TIMEOUT = float(getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+    UPSTREAM_TIMEOUTS = {
+        "cloze": (
+            UPSTREAM_CONNECT_TIMEOUT,
+            float(getenv("CLOZE_READ_TIMEOUT", 15)),
+        ),
+        "pricecloser": (
+            UPSTREAM_CONNECT_TIMEOUT,
+            float(getenv("PRICECLOSER_READ_TIMEOUT", 30)),
+        ),
+    }
+    REQUEST_BUDGET = int(getenv("REQUEST_BUDGET", 25))
+
+    # seconds a `PATCH`/`POST /v1/order` request syncs before handing the rest
+    # off to a job (see `api.hand_off`)
+    HANDOFF_BUDGET = int(getenv("HANDOFF_BUDGET", 10))
+    JOB_BUDGET_MARGIN = 10
+    MIN_CALL_SECONDS = 1
     SHARE_TO_TEAMS = True
 
     # OpenCart/Pricecloser variables
     OPENCART_RESTADMIN_ID = getenv("OPENCART_RESTADMIN_ID")
-    PRICECLOSER_BASE_URL = "http://pricecloser.com/api/rest_admin"
+    PRICECLOSER_BASE_URL = getenv(
+        "PRICECLOSER_BASE_URL", "http://pricecloser.com/api/rest_admin"
+    )
+    PRICECLOSER_WEBHOOK_SECRET = getenv("PRICECLOSER_WEBHOOK_SECRET")
+    WEBHOOK_DEDUPE_TTL = get_seconds(days=1)
 
 
 class Production(Config):
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+    gunicorn.conf
+    ~~~~~~~~~~~~~
+
+    Provides the gunicorn settings of the web dyno. Requests spend nearly all
+    of their time waiting on Cloze, PriceCloser, or redis, so each worker
+    serves many requests at once as gevent greenlets (see `manage loadtest`).
+"""
+# `preload_app` imports the app (and `requests`, `redis`, etc.) in the master,
+# so gevent has to patch sockets, ssl, and `time.sleep` before anything else
+from gevent import monkey
+
+monkey.patch_all()
+
+from os import getenv  # noqa: E402
+
+# one worker per CPU share of the dyno (Heroku sets `WEB_CONCURRENCY` by dyno
+# size)
+workers = int(getenv("WEB_CONCURRENCY", 3))
+worker_class = "gevent"
+
+# the greenlets of each worker
+worker_connections = int(getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+
+# load the app once (and share its memory with the workers)
+preload_app = True
+
+# recycle workers to bound any slow leaks (the jitter keeps them from all
+# restarting at once)
+max_requests = int(getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+
+# the router reuses connections to the dyno
+keepalive = int(getenv("GUNICORN_KEEPALIVE", 5))
+
+# the router gives up on a request after 30 seconds and a dyno gets 30 seconds
+# to exit after SIGTERM
+timeout = 30
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    """ Drops the connections the master may have opened (a worker must not
+    share a socket with its siblings)
+    """
+    from app import connection
+    from app.api import sessions
+
+    connection.reset_connection()
+    sessions.clear()
@@ -3,17 +3,21 @@
 # vim: sw=4:ts=4:expandtab
 
 """ A script to manage development tasks """
-from os import path as p
-from subprocess import call, check_call, CalledProcessError
+import sys
+
+from os import execv, path as p
+from collections import defaultdict
+from subprocess import call, check_call, run, CalledProcessError, PIPE
 from urllib.parse import urlsplit
 
 import pygogo as gogo
 
 from flask import current_app as app
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 
 from app import create_app
-from app.api import transfer_orders
+from app.api import transfer_orders, reconcile_orders
+from app.jobs import enqueue as enqueue_job, archive_failed_jobs
 
 BASEDIR = p.dirname(__file__)
 DEF_PORT = 5000
@@ -90,6 +94,15 @@ def lint(where, strict):
         exit(e.returncode)
 
 
+@manager.option("-w", "--where", help="Tests to run", default="tests")
+def test(where):
+    """Run the tests"""
+    try:
+        check_call([sys.executable, "-m", "pytest"] + where.split(" "))
+    except CalledProcessError as e:
+        exit(e.returncode)
+
+
 @manager.option("-r", "--remote", help="the heroku branch", default="staging")
 def add_keys(remote):
     """Deploy staging app"""
@@ -122,10 +135,164 @@ def enqueue(order_id=None):
         logger.debug(response)
 
 
-@manager.command
-def work():
+@manager.option("-s", "--start", help="Start date (YYYY-MM-DD)")
+@manager.option("-e", "--end", help="End date (YYYY-MM-DD)")
+@manager.option("-q", "--enqueue", help="Run as an rq job", action="store_true")
+def reconcile(start=None, end=None, enqueue=False):
+    """Enqueue repairs for orders that are missing or out of date in Cloze"""
+    with app.app_context():
+        if enqueue:
+            timeout = app.config["ROUTE_TIMEOUT"]
+            args = (reconcile_orders, start, end)
+            job = enqueue_job(*args, queue="low", job_timeout=timeout)
+            logger.info(f"Enqueued reconciliation job {job.id}.")
+        else:
+            response = reconcile_orders(start, end)
+            notify_or_log(response["ok"], response["message"])
+
+
+@manager.option("-i", "--interval", help="Seconds between syncs", type=int)
+@manager.option("-j", "--jitter", help="Max random delay (s) per sync", type=int)
+def schedule(interval=None, jitter=None):
+    """Periodically enqueue an incremental sync (one scheduler fires at a time)"""
+    from app.scheduler import run
+
+    kwargs = {"interval": interval, "jitter": jitter}
+    run(**{k: v for k, v in kwargs.items() if v is not None})
+
+
+@manager.option("-g", "--grace", help="Min age (s) of failed jobs to archive", type=int)
+def janitor(grace=None):
+    """Archive old failed jobs to a capped redis stream"""
+    kwargs = {"grace": grace} if grace is not None else {}
+    num_archived = archive_failed_jobs(**kwargs)
+    logger.info(f"Archived {num_archived} failed jobs.")
+
+
+@manager.option("-s", "--scenario", help="Scenario to run", action="append")
+@manager.option("-n", "--num-orders", help="Number of orders", type=int, default=100)
+@manager.option("-l", "--latency", help="Upstream latency (s)", type=float, default=0)
+@manager.option("-e", "--error-rate", help="Upstream error rate", type=float, default=0)
+@manager.option(
+    "-d", "--delay", help="Cloze consistency delay (s)", type=float, default=0
+)
+@manager.option("-t", "--tolerance", help="Allowed slowdown", type=float, default=0.25)
+@manager.option(
+    "-S", "--save", help="Save results as the baseline", action="store_true"
+)
+def bench(scenario=None, tolerance=0.25, save=False, delay=0, **kwargs):
+    """Benchmark the sync against local stand-in upstreams"""
+    from app import bench as _bench
+
+    with app.test_request_context():
+        results = _bench.run_benchmarks(scenario, consistency_delay=delay, **kwargs)
+
+    for name, result in results.items():
+        stats = ", ".join(f"{k}={v}" for k, v in sorted(result.items()))
+        logger.info(f"{name}: {stats}")
+
+    if save:
+        _bench.save_baseline(results)
+        logger.info(f"Saved baseline to {_bench.BASELINE_PATH}.")
+    else:
+        baseline = _bench.load_baseline()
+        regressions = list(_bench.gen_regressions(results, baseline, tolerance))
+
+        for regression in regressions:
+            logger.error(regression)
+
+        if regressions:
+            exit(1)
+
+
+@manager.option("-p", "--profile", help="gunicorn workers:connections", action="append")
+@manager.option("-c", "--concurrency", help="Concurrent clients", type=int, default=50)
+@manager.option("-d", "--duration", help="Seconds per profile", type=int, default=10)
+@manager.option("-l", "--latency", help="Upstream latency (s)", type=float, default=0.1)
+@manager.option("-n", "--num-orders", help="Number of orders", type=int, default=100)
+def loadtest(profile=None, **kwargs):
+    """Load test gunicorn profiles against local stand-in upstreams"""
+    from app import loadtest as _loadtest
+
+    profiles = [tuple(map(int, p.split(":"))) for p in profile or []]
+    results = _loadtest.run_loadtest(profiles, **kwargs)
+
+    for result in results:
+        stats = ", ".join(f"{k}={v}" for k, v in sorted(result.items()))
+        logger.info(stats)
+
+    best = max(results, key=lambda result: result["requests_per_sec"])
+    message = f"{best['workers']} workers with {best['connections']} connections "
+    message += f"served the most requests ({best['requests_per_sec']}/sec)."
+    logger.info(message)
+
+
+class StartupProfile(Command):
+    """Report the import-time breakdown of the app"""
+
+    option_list = (
+        Option("-M", "--module", help="Module to import", default="app.api"),
+        Option("-n", "--num", help="Number of packages to show", default=10, type=int),
+        Option("-b", "--budget", help="Max import time (in seconds)", type=float),
+    )
+
+    def run(self, module, num, budget=None):
+        # `-X importtime` writes `import time: self [us] | cumulative | name`
+        # lines to stderr, so profile a fresh interpreter
+        args = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+        completed = run(args, stderr=PIPE, universal_newlines=True, cwd=BASEDIR or ".")
+        timings = defaultdict(int)
+
+        for line in completed.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _self, _, name = line[12:].split("|")
+
+                if _self.strip().isdigit():
+                    timings[name.strip().split(".")[0]] += int(_self)
+
+        if completed.returncode:
+            logger.error(f"Failed to import {module}!")
+            exit(completed.returncode)
+
+        total = sum(timings.values()) / 10 ** 6
+        budget = app.config["IMPORT_TIME_BUDGET"] if budget is None else budget
+        ranked = sorted(timings.items(), key=lambda item: item[1], reverse=True)
+
+        for name, microseconds in ranked[:num]:
+            logger.info(f"{name:<24} {microseconds / 1000:8.1f} ms")
+
+        message = f"Importing {module} took {total:.3f}s (budget: {budget:.3f}s)."
+        notify_or_log(total <= budget, message)
+
+        if total > budget:
+            exit(1)
+
+
+manager.add_command("startup-profile", StartupProfile())
+
+
+@manager.option("-p", "--preload", help="Run jobs in this process", action="store_true")
+@manager.option("-j", "--max-jobs", help="Jobs before recycling", type=int)
+@manager.option("-M", "--max-memory", help="MB before recycling", type=int)
+def work(preload=False, max_jobs=None, max_memory=None):
     """Run the rq-worker"""
-    call("python -u worker.py", shell=True)
+    if preload or app.config["WORKER_PRELOAD"]:
+        # `app.api` and the app are already loaded, so jobs run inside this
+        # process (and app context) instead of a freshly forked one
+        from worker import work as _work
+
+        with app.app_context():
+            recycle = _work(
+                preload=True,
+                max_jobs=max_jobs or app.config["WORKER_MAX_JOBS"],
+                max_memory=max_memory or app.config["WORKER_MAX_MEMORY"],
+            )
+
+        if recycle:
+            logger.info("Restarting the rq-worker...")
+            execv(sys.executable, [sys.executable] + sys.argv)
+    else:
+        call("python -u worker.py", shell=True)
 
 
 if __name__ == "__main__":
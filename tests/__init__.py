@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.conftest
+    ~~~~~~~~~~~~~~
+
+    Provides the test fixtures
+"""
+from datetime import timedelta
+
+import pytest
+
+from redis.exceptions import RedisError
+
+from app import bench, create_app, jobs
+from app.dashboard import JOB_KEY, REGISTRIES
+from config import Config
+
+TRACEBACK = b"Traceback (most recent call last):\n  ...\nValueError: boom\n"
+
+
+@pytest.fixture
+def app():
+    app = create_app("Test")
+
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn():
+    """ The tests' own redis db (see `app.bench.isolated`), emptied before and
+    after each test
+    """
+    with bench.isolated(Config.TEST_REDIS_URL) as conn:
+        try:
+            conn.flushdb()
+        except RedisError:
+            pytest.skip("redis isn't available")
+
+        yield conn
+        conn.flushdb()
+
+
+@pytest.fixture
+def fail_job(conn):
+    """ Fails a job (long enough ago to archive) with the given traceback
+    """
+    from rq.utils import utcformat, utcnow
+
+    def fail_job(exc_info=TRACEBACK):
+        job = jobs.enqueue(jobs.trim_order, {"order_id": "1"})
+        ended_at = utcnow() - timedelta(seconds=jobs.FAILED_JOB_GRACE + 1)
+        mapping = {"exc_info": exc_info, "ended_at": utcformat(ended_at)}
+        mapping["status"] = "failed"
+        conn.hset(JOB_KEY.format(job.id), mapping=mapping)
+        conn.zadd(REGISTRIES["failed"].format("default"), {job.id: 0})
+        return job
+
+    return fail_job
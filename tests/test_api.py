@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_api
+    ~~~~~~~~~~~~~~
+
+    Provides the api tests
+"""
+import zlib
+
+import pytest
+
+from app import api, bench
+from app.standin import create_standin, gen_orders
+from tests.conftest import TRACEBACK
+
+
+@pytest.fixture
+def orders():
+    return list(gen_orders(10))
+
+
+@pytest.fixture
+def standin(app, conn, orders):
+    standin = create_standin(orders)
+
+    with bench.serve(standin) as url_root, bench.upstreams(url_root):
+        yield standin
+
+
+def test_range_handoff_syncs_inline_first(client, standin, orders):
+    # the real defaults: the handoff budget is no longer than the sleep
+    assert api.HANDOFF_BUDGET <= api.SYNC_SLEEP
+
+    start, end = bench.get_range(orders)
+    r = client.post(f"/v1/order/{start}/{end}")
+    json = r.get_json()
+
+    assert r.status_code == 202
+    assert len(json["skipped"]) < len(orders)
+    assert "after syncing 0 orders" not in json["message"]
+
+
+def test_handoff_job_timeout_scales(client, standin, orders):
+    start, end = bench.get_range(orders)
+    json = client.post(f"/v1/order/{start}/{end}").get_json()
+    job = api.get_queue().fetch_job(json["job_id"])
+
+    per_order = api.SYNC_SLEEP + api.CUSTOMER_LOCK_TTL
+    assert job.timeout == len(json["skipped"]) * per_order
+
+
+def test_results_errors(client, fail_job):
+    job_ids = [fail_job(zlib.compress(TRACEBACK)).id, fail_job(TRACEBACK).id]
+    body = {"job_ids": job_ids + ["missing"], "fields": ["job_status", "error"]}
+    r = client.post("/v1/results", json=body)
+    result = r.get_json()["result"]
+
+    assert r.status_code == 200
+    assert [result[job_id]["error"] for job_id in job_ids] == ["ValueError: boom"] * 2
+    assert [result[job_id]["job_status"] for job_id in job_ids] == ["failed"] * 2
+    assert result["missing"] == {"job_status": "job not found", "error": ""}
+
+
+def test_backfill_url(client, conn):
+    r = client.post("/v1/order/2020-01-01/2020-01-31?shards=2")
+    json = r.get_json()
+
+    assert r.status_code == 202
+    assert json["url"] == f"http://localhost/v1/backfill/{json['backfill_id']}"
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, encoding",
+    [("gzip", "gzip"), ("gzip;q=0", None), ("identity", None), ("br, *", "gzip")],
+)
+def test_export_encoding(client, conn, accept_encoding, encoding):
+    headers = {"Accept-Encoding": accept_encoding}
+    r = client.get("/v1/export/ledger", headers=headers)
+
+    assert r.headers.get("Content-Encoding") == encoding
+    assert "Accept-Encoding" in r.headers["Vary"]
+
+    data = zlib.decompress(r.data, 16 + zlib.MAX_WBITS) if encoding else r.data
+    assert data.decode("utf-8").startswith("order_id")
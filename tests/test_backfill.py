@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_backfill
+    ~~~~~~~~~~~~~~~~~~~
+
+    Provides the backfill tests
+"""
+import pytest
+
+from rq import Queue
+
+from app import backfill, jobs
+from worker import CompactJob, PreloadedWorker
+
+WINDOW = "2020-01-01:2020-01-31"
+
+
+def sync_deferred():
+    return {"ok": True, "message": "", "status_code": 200}
+
+
+def fail_deferred():
+    raise ValueError("boom")
+
+
+@pytest.mark.parametrize(
+    "func, status", [(sync_deferred, "done"), (fail_deferred, "failed")]
+)
+def test_finish_deferred(conn, func, status):
+    backfill_id = "test"
+    meta = {"start": "2020-01-01", "end": "2020-01-31"}
+    conn.hset(backfill.META_KEY.format(backfill_id), mapping=meta)
+    conn.hset(backfill.WINDOWS_KEY.format(backfill_id), WINDOW, "deferred")
+
+    job = jobs.enqueue(func)
+    backfill.wait_for(backfill_id, WINDOW, [job.id])
+
+    queues = [Queue(name, connection=conn) for name in ["high", "default"]]
+    PreloadedWorker(queues, connection=conn, job_class=CompactJob).work(burst=True)
+
+    progress = backfill.get_progress(backfill_id)
+    assert progress["windows"] == {WINDOW: status}
+    assert not conn.exists(backfill.PENDING_KEY.format(backfill_id, WINDOW))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_breaker
+    ~~~~~~~~~~~~~~~~~~
+
+    Provides the circuit breaker tests
+"""
+from rq.job import Job
+
+from app import breaker, jobs
+
+
+def park_jobs(conn, num_jobs):
+    for _ in range(num_jobs):
+        args = ({"order_id": "1"},)
+        job = Job.create(jobs.trim_order, args, connection=conn, origin="default")
+        breaker.park(job)
+
+    return jobs.get_queue(breaker.DEFERRED_QUEUE)
+
+
+def test_close_resumes_in_a_job(conn):
+    deferred = park_jobs(conn, 3)
+    breaker.close("cloze")
+
+    assert deferred.count == 3
+    assert [job.func_name for job in jobs.get_queue("high").jobs] == [
+        "app.breaker.resume"
+    ]
+
+
+def test_resume_is_capped(conn):
+    deferred = park_jobs(conn, 5)
+
+    assert breaker.resume(batch_size=2, max_jobs=3) == 3
+    assert deferred.count == 2
+    assert jobs.get_queue().count == 3
+
+    assert breaker.resume(batch_size=2, max_jobs=3) == 2
+    assert deferred.count == 0
+    assert jobs.get_queue().count == 5
+
+
+def test_half_open_resumes_a_probe(conn):
+    deferred = park_jobs(conn, 3)
+    conn.set(breaker.TRIPPED_KEY.format("cloze"), 1)
+
+    assert breaker.resume() == 1
+    assert deferred.count == 2
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_index
+    ~~~~~~~~~~~~~~~~
+
+    Provides the order index tests
+"""
+import pytest
+
+from app import api, bench, index
+from app.standin import create_standin, gen_orders
+
+
+def test_person_key_is_the_email(conn):
+    # a person created by the sync has no direct id until Cloze is read again
+    index.record_sync("1", "Me@Example.com", "p1", "me@example.com")
+    index.record_sync("2", "me@example.com", "p2", "direct:5")
+
+    assert index.is_synced("1", "me@example.com")
+    assert index.is_synced("2", "Me@Example.com")
+    assert index.is_linked("1", "me@example.com")
+    assert index.has_order("me@example.com", "2")
+    assert index.get_person_id("me@example.com") == "direct:5"
+
+    ledger = {row["order_id"]: row["person_id"] for row in index.gen_ledger()}
+    assert ledger == {"1": "direct:5", "2": "direct:5"}
+
+    assert index.forget("1") == 2
+    assert not index.is_synced("1", "me@example.com")
+    assert index.is_synced("2", "me@example.com")
+
+
+@pytest.fixture
+def orders():
+    # two orders from the same customer
+    return list(gen_orders(2, customers_per_order=0))
+
+
+def test_customer_synced_twice(app, conn, orders):
+    standin = create_standin(orders)
+
+    with bench.serve(standin) as url_root, bench.upstreams(url_root):
+        for order in orders:
+            assert api.add_customer_and_order(order)["ok"]
+
+        assert all(map(api.is_synced, orders))
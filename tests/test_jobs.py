@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_jobs
+    ~~~~~~~~~~~~~~~
+
+    Provides the job helper tests
+"""
+import zlib
+
+import pytest
+
+from app import jobs
+from tests.conftest import TRACEBACK
+
+
+@pytest.mark.parametrize("exc_info", [zlib.compress(TRACEBACK), TRACEBACK])
+def test_get_error(exc_info):
+    assert jobs.get_error(exc_info) == "ValueError: boom"
+
+
+def test_get_error_empty():
+    assert jobs.get_error(None) == ""
+
+
+def test_archive_failed_jobs(conn, fail_job):
+    fail_job(zlib.compress(TRACEBACK))
+    fail_job(TRACEBACK)
+
+    assert jobs.archive_failed_jobs() == 2
+
+    summaries = conn.xrange(jobs.ARCHIVE_KEY)
+    assert [fields[b"error"] for _, fields in summaries] == [b"ValueError: boom"] * 2
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_transform
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Provides the batch transform tests
+"""
+from app import api, transform
+from app.standin import gen_orders
+
+
+def test_payloads_match_per_order(app):
+    orders = list(gen_orders(20))
+    payloads = list(transform.gen_payloads(orders, [""] * len(orders)))
+
+    assert payloads == [
+        (api.create_customer_data(order, "people"), api.create_order_data(order, ""))
+        for order in orders
+    ]
+
+
+def test_missing_columns(app):
+    orders = [{**order, "telephone": None} for order in gen_orders(2)]
+    del orders[1]["telephone"]
+    customer_data, _ = zip(*transform.gen_payloads(orders))
+
+    assert [data["phones"] for data in customer_data] == [[{"value": None}]] * 2
+
+
+def test_gen_customer_orders():
+    orders = list(gen_orders(20))
+    del orders[0]["email"]
+    groups = list(api.gen_customer_orders(orders))
+
+    assert sum(map(len, groups)) == len(orders)
+    assert groups[0] == [orders[0]]
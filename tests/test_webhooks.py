@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_webhooks
+    ~~~~~~~~~~~~~~~~~~~
+
+    Provides the PriceCloser webhook tests
+"""
+import pytest
+
+from redis.exceptions import RedisError
+
+from app import jobs, webhooks
+
+BODY = {"event": "order.created", "order_id": "1", "timestamp": "2020-01-01 10:00"}
+
+
+@pytest.fixture
+def signed(monkeypatch):
+    monkeypatch.setattr(webhooks, "PRICECLOSER_WEBHOOK_SECRET", "secret")
+    monkeypatch.setattr(webhooks, "verify", lambda body, signature: True)
+
+
+def test_duplicates_are_ignored(client, conn, signed):
+    assert client.post("/v1/webhook/pricecloser", json=BODY).status_code == 202
+
+    r = client.post("/v1/webhook/pricecloser", json=BODY)
+    assert r.status_code == 200
+    assert r.get_json()["message"].startswith("Already received")
+
+
+def test_failed_enqueue_is_retried(client, conn, signed, monkeypatch):
+    enqueue = jobs.enqueue
+
+    def fail(*args, **kwargs):
+        raise RedisError("down")
+
+    monkeypatch.setattr(jobs, "enqueue", fail)
+
+    with pytest.raises(RedisError):
+        client.post("/v1/webhook/pricecloser", json=BODY)
+
+    monkeypatch.setattr(jobs, "enqueue", enqueue)
+    assert client.post("/v1/webhook/pricecloser", json=BODY).status_code == 202
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# vim: sw=4:ts=4:expandtab
+"""
+    tests.test_worker
+    ~~~~~~~~~~~~~~~~~
+
+    Provides the worker tests
+"""
+import resource
+
+from rq import Queue
+
+from worker import CompactJob, PreloadedWorker, get_memory_usage
+
+
+def noop():
+    return {"ok": True, "status_code": 200}
+
+
+def test_memory_usage_is_current():
+    peak = bytearray(256 * 1024 ** 2)
+    during = get_memory_usage()
+    del peak
+
+    assert get_memory_usage() < during - 128
+
+
+def test_preloaded_worker_ignores_peak_memory(conn):
+    bytearray(256 * 1024 ** 2)  # raises the peak, which a re-exec keeps
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    max_memory = get_memory_usage() + 64
+    assert peak > max_memory
+
+    queue = Queue(connection=conn, job_class=CompactJob)
+    queue.enqueue(noop)
+    worker = PreloadedWorker(
+        [queue], connection=conn, job_class=CompactJob, max_memory=max_memory
+    )
+    worker.work(burst=True)
+
+    assert worker.completed_jobs == 1
+    assert not worker.recycle
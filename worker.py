@@ -5,12 +5,159 @@
 
     Provides the rq worker
 """
+import os
+import resource
+import sys
+
+from app import backfill, breaker, budget, instrument, jobs, metrics, progress
 from app.connection import conn
-from rq import Worker, Queue, Connection
+from rq import Worker, SimpleWorker, Queue, Connection
+from rq.job import Job
 
 listen = ['high', 'default', 'low']
 
-if __name__ == '__main__':
+
+def get_memory_usage():
+    """Returns the current resident memory of this process (in MB)"""
+    # not ru_maxrss: it's the peak (which also survives the re-exec in `manage
+    # work`), so a worker that once crossed `max_memory` would recycle after
+    # every job
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        # no /proc (e.g., macOS), so fall back to the peak (in kilobytes)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+class CompactJob(Job):
+    """Only stores the status and ids of a job's result (see `jobs.compact`)"""
+    def _execute(self):
+        response = super()._execute()
+        order = self.args[0] if self.args else None
+        order_id = order.get('order_id') if isinstance(order, dict) else None
+        return jobs.compact(response, order_id)
+
+
+class JobHooksMixin(object):
+    """Records upstream call stats of each job in the job's meta, updates the
+    job metrics (see `app.metrics`), limits each job to its budget (see
+    `app.budget`), parks the upstream jobs while a circuit breaker is open
+    (see `app.breaker`), publishes each job's status changes (see
+    `app.progress`), and fails the backfill windows waiting on a failed job
+    (see `app.backfill`)"""
+    def execute_job(self, job, queue):
+        # parking happens here (rather than in the work horse) since a forking
+        # worker fails any job the horse leaves unfinished
+        if breaker.should_park(job):
+            breaker.park(job)
+        else:
+            return super().execute_job(job, queue)
+
+    def prepare_job_execution(self, job, *args, **kwargs):
+        super().prepare_job_execution(job, *args, **kwargs)
+        progress.publish(job, 'started')
+
+    def handle_job_success(self, job, *args, **kwargs):
+        super().handle_job_success(job, *args, **kwargs)
+        progress.publish(job, 'finished')
+
+    def handle_job_failure(self, job, *args, **kwargs):
+        # also runs (in the worker) when a work horse dies
+        super().handle_job_failure(job, *args, **kwargs)
+        progress.publish(job, 'failed')
+
+        # a job that failed since a breaker opened gets requeued (see
+        # `handle_exception`), so whatever waits on it keeps waiting
+        exc_type = sys.exc_info()[0]
+
+        if not (exc_type and issubclass(exc_type, breaker.CircuitOpenError)):
+            backfill.release_waiting(job)
+
+    def handle_exception(self, job, *exc_info):
+        if exc_info and issubclass(exc_info[0], breaker.CircuitOpenError):
+            breaker.defer_failed(job)
+
+        return super().handle_exception(job, *exc_info)
+
+    def perform_job(self, job, queue, *args, **kwargs):
+        seconds = budget.get_job_budget(job)
+
+        with instrument.recording() as stats, budget.budgeting(seconds):
+            performed = super().perform_job(job, queue, *args, **kwargs)
+
+        instrument.save_job_stats(job, stats)
+        metrics.record_job(job, performed, stats)
+        return performed
+
+    def run_maintenance_tasks(self):
+        """Also archives old failed jobs (rq runs this every 10 minutes)"""
+        super().run_maintenance_tasks()
+        jobs.archive_failed_jobs()
+
+
+class ForkingWorker(JobHooksMixin, Worker):
+    pass
+
+
+class PreloadedWorker(JobHooksMixin, SimpleWorker):
+    """Runs jobs in-process (no fork per job) so that `app.api`, the flask app,
+    and any open HTTP sessions are loaded once and reused across jobs.
+
+    Since nothing gets cleaned up by exiting a work horse, the worker stops
+    itself (and sets `recycle`) after `max_jobs` jobs or once it uses more than
+    `max_memory` MB.
+    """
+    def __init__(self, *args, max_jobs=None, max_memory=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.completed_jobs = 0
+        self.recycle = False
+
+    def execute_job(self, job, queue):
+        result = super().execute_job(job, queue)
+        self.completed_jobs += 1
+        memory = get_memory_usage()
+
+        if self.max_jobs and self.completed_jobs >= self.max_jobs:
+            reason = '%d jobs' % self.completed_jobs
+        elif self.max_memory and memory > self.max_memory:
+            reason = '%d MB (max %d MB)' % (memory, self.max_memory)
+        else:
+            reason = ''
+
+        if reason:
+            self.log.info('Worker %s: recycling after %s', self.key, reason)
+            self.recycle = True
+            self._stop_requested = True
+
+        return result
+
+
+def work(preload=False, max_jobs=None, max_memory=None):
+    """Runs the worker until it is stopped
+
+    Returns:
+        (bool): True if the worker stopped in order to be recycled
+    """
     with Connection(conn):
-        worker = Worker(map(Queue, listen))
+        queues = list(map(Queue, listen))
+
+        if preload:
+            worker = PreloadedWorker(
+                queues, job_class=CompactJob, max_jobs=max_jobs,
+                max_memory=max_memory
+            )
+        else:
+            worker = ForkingWorker(queues, job_class=CompactJob)
+
         worker.work()
+
+    return getattr(worker, 'recycle', False)
+
+
+if __name__ == '__main__':
+    work()